@@ -1,28 +1,52 @@
-import logging
-
-from flasgger import Swagger
 from flask import Flask
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
-from flask_mail import Mail
 
+import app.controllers.admin_changes as admin_changes
 import app.controllers.admin_conferences as admin_conferences
+import app.controllers.admin_jobs as admin_jobs
 import app.controllers.admin_user_management as admin_user_management
-from app.helpers.extensions import mongo
+import app.controllers.metrics as metrics
+from app.helpers.extensions import init_mongo
+from app.helpers.helpers_compression import init_compression
+from app.helpers.helpers_database import init_read_your_writes
+from app.helpers.helpers_json import init_json
+from app.helpers.helpers_logging import init_logging
+from app.helpers.helpers_metrics import init_metrics
+from app.helpers.helpers_validation import build_request_schemas
+from app.helpers.helpers_workers import preload_for_workers, start_background_tasks
+
 
-mail = Mail()
+def register_blueprints(app):
+    app.register_blueprint(admin_user_management.app)
+    app.register_blueprint(admin_conferences.app)
+    app.register_blueprint(admin_jobs.app)
+    app.register_blueprint(admin_changes.app)
+    app.register_blueprint(metrics.app)
 
-def create_app():
+
+def create_app(preload=False):
     app = Flask(__name__)
-    Swagger(app)
     CORS(app)
     app.config.from_envvar('FLASK_CONFIG_FILE')
-    mongo.init_app(app)
-    app.logger.setLevel(logging.DEBUG)
+    init_logging(app)
+    init_metrics(app)
+    init_mongo(app)
+    init_json(app)
     jwt = JWTManager(app)
-    app.register_blueprint(admin_user_management.app)
-    app.register_blueprint(admin_conferences.app)
-    mail.init_app(app)
+    init_read_your_writes(app)
+    init_compression(app)
+    register_blueprints(app)
+    # Flask-Mail is initialised by the mail queue the first time a message is sent
+    from app.swagger_spec import init_api_docs, request_schemas_field
+    spec = init_api_docs(app)
+    if app.config.get('REQUEST_VALIDATION', True):
+        build_request_schemas(app, spec.get(request_schemas_field) if spec is not None else None)
+    if preload:
+        # for pre-forking servers (app.wsgi): connections and background threads are started by each worker
+        preload_for_workers(app)
+    else:
+        start_background_tasks(app)
 
     return app
 
@@ -0,0 +1,68 @@
+from flask import Blueprint, current_app, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+from app.helpers.helpers_authorization import verify_program_committee
+from app.helpers.helpers_changes import list_changes
+
+app = Blueprint("admin_changes", __name__, url_prefix="")
+
+
+@app.route("/api/admin/changes", methods=['GET'])
+@jwt_required
+def admin_get_changes():
+    """
+            Endpoint for the changes made to users, conferences and sessions after a cursor
+
+            Requires JWT authorization and user to be ADMIN or PROGRAM_COMMITTEE
+
+            *Without since only the current cursor is returned: take it before loading the full data, then poll with
+            since=next_cursor and apply the changes in order. A change only names the entity and key that changed,
+            the current state is read from the usual endpoints.*
+            ---
+            parameters:
+              - name: since
+                in: query
+                type: string
+                required: false
+                description: next_cursor of the previous page
+              - name: limit
+                in: query
+                type: integer
+                required: false
+                description: Changes per page, 1000 by default
+            responses:
+              200:
+                description: Changes after the cursor in the order they were made.
+                schema:
+                    id:
+                    properties:
+                        msg:
+                            type: object
+                            properties:
+                                changes:
+                                    type: array
+                                    items:
+                                        type: object
+                                    example: [{"seq": 42, "entity": "user", "key": "cosminPopa97", "op": "create"},
+                                              {"seq": 43, "entity": "session", "key": 12, "op": "delete"}]
+                                next_cursor:
+                                    type: string
+                                    example: "43"
+                                has_more:
+                                    type: boolean
+              400:
+                description: Returns if since or limit is invalid
+              403:
+                description: Returns if user does not have role ADMINISTRATOR or PROGRAM_COMMITTEE
+              410:
+                description: Returns if the changes after since are no longer retained and the data must be reloaded
+    """
+    verify_program_committee(get_jwt_identity())
+    try:
+        limit = int(request.args.get('limit', 1000))
+    except ValueError:
+        return jsonify({"msg": "Invalid limit."}), 400
+    if not 0 < limit <= int(current_app.config.get('CHANGE_FEED_PAGE_MAX_SIZE', 10000)):
+        return jsonify({"msg": "Invalid limit."}), 400
+    response, status_code = list_changes(request.args.get('since'), limit)
+    return jsonify({"msg": response}), status_code
@@ -1,15 +1,20 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
+from app.helpers.helpers_admission import admission_controlled
 from app.helpers.helpers_authorization import verify_administrator, verify_program_committee
 from app.helpers.helpers_conferences import create_conference, update_conference, delete_conference, \
-    update_conference_sessions, delete_session
+    update_conference_sessions, delete_session, delete_sessions, replace_conference_schedule, find_sessions
+from app.helpers.helpers_jobs import submit_job
+from app.helpers.helpers_validation import validate_request_body
 
 app = Blueprint("admin_conferences", __name__, url_prefix="")
 
 
 @app.route("/api/admin/conferences", methods=['POST'])
 @jwt_required
+@admission_controlled
+@validate_request_body
 def admin_create_conferences():
     """
             Endpoint for conference creation
@@ -20,6 +25,7 @@ def admin_create_conferences():
                 in: body
                 required: true
                 schema:
+                    required: [title, location, country, start_date, end_date]
                     id:
                     properties:
                         title:
@@ -79,6 +85,8 @@ def admin_create_conferences():
 
 @app.route("/api/admin/conferences", methods=['PUT'])
 @jwt_required
+@admission_controlled
+@validate_request_body
 def admin_update_conferences():
     """
                 Endpoint for conference updates
@@ -89,6 +97,8 @@ def admin_update_conferences():
                     in: body
                     required: true
                     schema:
+                        required: [title, location, country, start_date, end_date, path_to_logo, path_to_description]
+                        additionalProperties: false
                         id:
                         properties:
                             title:
@@ -156,24 +166,247 @@ def admin_update_conferences():
 
 @app.route("/api/admin/conferences/sessions", methods=['PUT'])
 @jwt_required
+@admission_controlled
 def admin_add_sessions():
     verify_program_committee(get_jwt_identity())
     sessions = request.json
-    response, status_code = update_conference_sessions(sessions)
+    if request.args.get('async') == '1':
+        response, status_code = submit_job('update_conference_sessions', sessions)
+    else:
+        response, status_code = update_conference_sessions(sessions)
     return jsonify({"msg": response}), status_code
 
 
+@app.route("/api/admin/conferences/sessions", methods=['GET'])
+@jwt_required
+def admin_get_sessions():
+    """
+            Endpoint for reading sessions, ordered by start time, one page at a time
+
+            Requires JWT authorization and user to be ADMIN or PROGRAM_COMMITTEE
+
+            *Pass the returned next_cursor back as cursor to read the next page; it is null on the last page.*
+            ---
+            parameters:
+              - name: conferenceId
+                in: query
+                type: integer
+                required: false
+              - name: from
+                in: query
+                type: number
+                required: false
+                description: Only sessions starting at or after this time.
+              - name: to
+                in: query
+                type: number
+                required: false
+                description: Only sessions starting before this time.
+              - name: fields
+                in: query
+                type: string
+                required: false
+                description: Comma separated fields to return; eventId and startTime are always included.
+              - name: limit
+                in: query
+                type: integer
+                required: false
+                default: 100
+              - name: cursor
+                in: query
+                type: string
+                required: false
+            responses:
+              200:
+                description: One page of sessions and the cursor of the next page.
+                schema:
+                    id:
+                    properties:
+                        msg:
+                            type: object
+                            properties:
+                                sessions:
+                                    type: array
+                                    items:
+                                        type: object
+                                next_cursor:
+                                    type: string
+              400:
+                description: Returns if a query parameter is invalid
+              403:
+                description: Returns if user does not have role ADMINISTRATOR or PROGRAM_COMMITTEE
+    """
+    verify_program_committee(get_jwt_identity())
+    try:
+        conference_id = _number_arg('conferenceId')
+        start = _number_arg('from')
+        end = _number_arg('to')
+        limit = min(int(request.args.get('limit', 100)), int(current_app.config.get('SESSION_PAGE_MAX_SIZE', 1000)))
+    except ValueError:
+        return jsonify({"msg": "Invalid query parameters."}), 400
+    if limit < 1:
+        return jsonify({"msg": "Invalid query parameters."}), 400
+    fields = [field for field in request.args.get('fields', '').split(',') if field]
+    response, status_code = find_sessions(conference_id=conference_id, start=start, end=end, fields=fields,
+                                          limit=limit, cursor=request.args.get('cursor'))
+    return jsonify({"msg": response}), status_code
+
+
+def _number(value):
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def _number_arg(name):
+    # not request.args.get(type=...), which turns a ValueError into None and would drop the filter silently
+    return _number(request.args[name]) if name in request.args else None
+
+
 @app.route("/api/admin/conferences/sessions", methods=['DELETE'])
 @jwt_required
+@admission_controlled
+@validate_request_body
 def admin_delete_sessions():
+    """
+            Endpoint for session deletion
+
+            Requires JWT authorization and user to be ADMIN or PROGRAM_COMMITTEE
+
+            *Send exactly one of eventId (one session), eventIds (a list of sessions) or conferenceId (every session
+            of the conference).*
+            ---
+            parameters:
+              - name:
+                in: body
+                required: true
+                schema:
+                    id:
+                    properties:
+                        eventId:
+                            type: integer
+                            example: 12
+                        eventIds:
+                            type: array
+                            items:
+                                type: integer
+                            example: [12, 13, 14]
+                        conferenceId:
+                            type: integer
+                            example: 1
+            responses:
+              200:
+                description: Returns the number of deleted sessions for eventIds or conferenceId.
+                schema:
+                    id:
+                    properties:
+                        msg:
+                            type: object
+                            properties:
+                                deleted_count:
+                                    type: integer
+                                    example: 3
+              204:
+                description: Returns when a single eventId was deleted.
+              400:
+                description: Returns if none of eventId, eventIds or conferenceId is given
+              403:
+                description: Returns if user does not have role ADMINISTRATOR or PROGRAM_COMMITTEE
+    """
+    verify_program_committee(get_jwt_identity())
+    body = request.json or {}
+    if 'eventId' in body:
+        response, status_code = delete_session(body['eventId'])
+    else:
+        response, status_code = delete_sessions(event_ids=body.get('eventIds'), conference_id=body.get('conferenceId'))
+    return jsonify({"msg": response}), status_code
+
+
+@app.route("/api/admin/conferences/sessions/schedule", methods=['PUT'])
+@jwt_required
+@admission_controlled
+@validate_request_body
+def admin_replace_schedule():
+    """
+            Endpoint for replacing the whole schedule of a conference
+
+            Requires JWT authorization and user to be ADMIN or PROGRAM_COMMITTEE
+
+            *The given sessions are compared with the stored schedule of the conference: new and changed sessions are
+            upserted, sessions missing from the request are deleted and unchanged ones are not written. Sessions that
+            overlap in the same room or for the same speaker are reported in conflicts, or rejected with 409 when
+            SCHEDULE_CONFLICT_MODE is reject.*
+            ---
+            parameters:
+              - name:
+                in: body
+                required: true
+                schema:
+                    required: [conferenceId, sessions]
+                    id:
+                    properties:
+                        conferenceId:
+                            type: integer
+                            example: 1
+                        sessions:
+                            type: array
+                            items:
+                                type: object
+                            example: [{"eventId": 12, "title": "Keynote", "room": "Aula Magna"}]
+            responses:
+              200:
+                description: Counts of the writes done to bring the stored schedule in line with the request.
+                schema:
+                    id:
+                    properties:
+                        msg:
+                            type: object
+                            properties:
+                                matched_count:
+                                    type: integer
+                                upserted_count:
+                                    type: integer
+                                modified_count:
+                                    type: integer
+                                deleted_count:
+                                    type: integer
+                                unchanged_count:
+                                    type: integer
+                                write_errors:
+                                    type: array
+                                    items:
+                                        type: object
+                                conflict_count:
+                                    type: integer
+                                conflicts:
+                                    type: array
+                                    items:
+                                        type: object
+                                    example: [{"type": "room", "resource": "Aula Magna", "conferenceId": 1,
+                                               "sessions": [{"index": null, "eventId": 11},
+                                                            {"index": 0, "eventId": 12}]}]
+              207:
+                description: Returns the same counts when some sessions could not be written.
+              400:
+                description: Returns if conferenceId or sessions are missing or a session has no eventId
+              409:
+                description: Returns conflict_count and conflicts when sessions overlap and nothing was written
+              403:
+                description: Returns if user does not have role ADMINISTRATOR or PROGRAM_COMMITTEE
+    """
     verify_program_committee(get_jwt_identity())
-    event_id = request.json['eventId']
-    response, status_code = delete_session(event_id)
+    body = request.json or {}
+    if 'conferenceId' not in body or 'sessions' not in body:
+        return jsonify({"msg": "Request needs conferenceId and sessions."}), 400
+    response, status_code = replace_conference_schedule(body['conferenceId'], body['sessions'])
     return jsonify({"msg": response}), status_code
 
 
 @app.route("/api/admin/conferences", methods=['DELETE'])
 @jwt_required
+@admission_controlled
+@validate_request_body
 def admin_delete_conferences():
     """
             Endpoint for conference deletion
@@ -184,6 +417,7 @@ def admin_delete_conferences():
                 in: body
                 required: true
                 schema:
+                    required: [title]
                     id:
                     properties:
                         title:
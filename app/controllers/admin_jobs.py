@@ -0,0 +1,66 @@
+from flask import Blueprint, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+from app.helpers.helpers_authorization import verify_program_committee
+from app.helpers.helpers_jobs import get_job
+
+app = Blueprint("admin_jobs", __name__, url_prefix="")
+
+
+@app.route("/api/admin/jobs/<job_id>", methods=['GET'])
+@jwt_required
+def admin_get_job(job_id):
+    """
+            Endpoint for the progress of a background job started with async=1
+
+            Requires JWT authorization and user to be ADMIN or PROGRAM_COMMITTEE
+            ---
+            parameters:
+              - name: job_id
+                in: path
+                type: string
+                required: true
+            responses:
+              200:
+                description: Progress of the job and the errors of the items processed so far.
+                schema:
+                    id:
+                    properties:
+                        msg:
+                            type: object
+                            properties:
+                                id:
+                                    type: string
+                                    example: 5c1f0d6c2a6d4c4f9d0b1e3a7c9f2b11
+                                kind:
+                                    type: string
+                                    example: create_users
+                                status:
+                                    type: string
+                                    example: running
+                                total:
+                                    type: integer
+                                    example: 5000
+                                processed:
+                                    type: integer
+                                    example: 1200
+                                errors:
+                                    type: array
+                                    items:
+                                        type: object
+                                    example: [{"index": 212, "status": 400,
+                                               "msg": "Usernames already exist: cosminPopa97."}]
+              403:
+                description: Returns if user does not have role ADMINISTRATOR or PROGRAM_COMMITTEE
+                schema:
+                    id:
+                    properties:
+                        msg:
+                            type: string
+                            example: Invalid role for request
+              404:
+                description: Returns if the job does not exist
+    """
+    verify_program_committee(get_jwt_identity())
+    response, status_code = get_job(job_id)
+    return jsonify({"msg": response}), status_code
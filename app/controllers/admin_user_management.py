@@ -1,14 +1,25 @@
-from flask import Blueprint, request, jsonify
+import io
+
+from flask import Blueprint, Response, current_app, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
+from app.helpers.helpers_admission import admission_controlled
 from app.helpers.helpers_authorization import verify_administrator
-from app.helpers.helpers_user_management import create_users, update_users, delete_users, get_users
+from app.helpers.helpers_cache import get_response_cache
+from app.helpers.helpers_database import reads_pinned_to_writer
+from app.helpers.helpers_jobs import submit_job
+from app.helpers.helpers_responses import json_msg_chunks, json_msg_page_chunks, stream_response
+from app.helpers.helpers_user_management import create_users, update_users, delete_users, get_users, \
+    import_users
+from app.helpers.helpers_validation import validate_request_body
 
 app = Blueprint("admin_user_management", __name__, url_prefix="")
 
 
 @app.route("/api/admin/users", methods=['POST'])
 @jwt_required
+@admission_controlled
+@validate_request_body
 def admin_create_user():
     """
             Endpoint for user creation
@@ -23,6 +34,8 @@ def admin_create_user():
                 required: true
                 type: array
                 schema:
+                    required: [username, password, first_name, last_name, valid_account, is_phd, educational_title,
+                               conference_id, roles]
                     id:
                     name:
                     type: array
@@ -48,6 +61,20 @@ def admin_create_user():
                         educational_title:
                             type: string
                             example: Profesor Doctor Inginer
+                        conference_id:
+                            type: integer
+                            example: 1
+                        roles:
+                            type: array
+                            items:
+                                type: integer
+                            example: [1, 2]
+              - name: async
+                in: query
+                type: string
+                enum: ['1']
+                required: false
+                description: Run the batch as a background job and return its id.
             responses:
               200:
                 description: Validates that user was created successfully.
@@ -57,6 +84,17 @@ def admin_create_user():
                         msg:
                             type: string
                             example: Users created successfully.
+              202:
+                description: Returns the id of the background job when called with async=1.
+                schema:
+                    id:
+                    properties:
+                        msg:
+                            type: object
+                            properties:
+                                job_id:
+                                    type: string
+                                    example: 5c1f0d6c2a6d4c4f9d0b1e3a7c9f2b11
               400:
                 description: Returns if request is invalid
                 schema:
@@ -73,6 +111,8 @@ def admin_create_user():
                         msg:
                             type: string
                             example: Invalid role for request
+              429:
+                description: Returns if too many bulk requests are running or waiting, with a Retry-After header
               500:
                 description: Returns if something goes wrong with the sql query
                 schema:
@@ -84,12 +124,99 @@ def admin_create_user():
     """
     verify_administrator(get_jwt_identity())
     users = request.json
-    response, status_code = create_users(users)
+    if request.args.get('async') == '1':
+        response, status_code = submit_job('create_users', users)
+    else:
+        response, status_code = create_users(users)
+    return jsonify({"msg": response}), status_code
+
+
+@app.route("/api/admin/users/import", methods=['POST'])
+@jwt_required
+@admission_controlled
+def admin_import_users():
+    """
+            Endpoint for bulk user import from a CSV or NDJSON file
+
+            Requires JWT authorization and user to be ADMIN
+
+            *Rows are validated and inserted in fixed-size chunks while the file is read. CSV files need a header
+            row with the same fields as user creation; roles are separated by ';'. NDJSON files hold one user
+            object per line.*
+            ---
+            consumes:
+              - multipart/form-data
+              - text/csv
+              - application/x-ndjson
+            parameters:
+              - name: file
+                in: formData
+                type: file
+                required: false
+                description: The file to import. The raw request body is used when no file is uploaded.
+              - name: format
+                in: query
+                type: string
+                enum: [csv, ndjson]
+                required: false
+                description: Overrides the format detected from the file name or content type.
+            responses:
+              200:
+                description: Summary of the import, with line numbers for skipped rows.
+                schema:
+                    id:
+                    properties:
+                        msg:
+                            type: object
+                            properties:
+                                inserted:
+                                    type: integer
+                                    example: 49998
+                                duplicates:
+                                    type: array
+                                    items:
+                                        type: object
+                                    example: [{"line": 12, "username": "cosminPopa97"}]
+                                invalid:
+                                    type: array
+                                    items:
+                                        type: object
+                                    example: [{"line": 40, "error": "Missing fields: password."}]
+              400:
+                description: Returns if the format is unsupported or the file cannot be parsed
+              403:
+                description: Returns if user does not have role ADMINISTRATOR
+                schema:
+                    id:
+                    properties:
+                        msg:
+                            type: string
+                            example: Invalid role for request
+              429:
+                description: Returns if too many bulk requests are running or waiting, with a Retry-After header
+              500:
+                description: Returns if something goes wrong with the sql query, with the summary so far
+    """
+    verify_administrator(get_jwt_identity())
+    upload = request.files.get('file')
+    if upload is not None:
+        stream, filename, content_type = upload.stream, upload.filename or '', upload.mimetype
+    else:
+        stream, filename, content_type = request.stream, '', request.mimetype
+    file_format = request.args.get('format')
+    if file_format is None:
+        if filename.endswith('.csv') or content_type == 'text/csv':
+            file_format = 'csv'
+        elif filename.endswith(('.ndjson', '.jsonl')) or content_type in ('application/x-ndjson', 'application/jsonl'):
+            file_format = 'ndjson'
+    response, status_code = import_users(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''), file_format)
     return jsonify({"msg": response}), status_code
 
 
 @app.route("/api/admin/users", methods=['PUT'])
 @jwt_required
+@admission_controlled
+@validate_request_body
 def admin_update_user():
     """
             Endpoint for user updates, using username as id (username will not be changed.)
@@ -104,6 +231,7 @@ def admin_update_user():
                 required: true
                 type: array
                 schema:
+                    required: [username, first_name, last_name, valid_account, is_phd, educational_title]
                     id:
                     name:
                     type: array
@@ -128,21 +256,36 @@ def admin_update_user():
                             example: Profesor Doctor Inginer
             responses:
               200:
-                description: Validates that user was updated successfully.
+                description: Reports, per username, whether the user was updated, left unchanged or not found.
                 schema:
                     id:
                     properties:
                         msg:
-                            type: string
-                            example: Users created successfully.
-              204:
-                description: Returns if no update has been applied.
+                            type: object
+                            properties:
+                                updated:
+                                    type: array
+                                    items:
+                                        type: string
+                                    example: [cosminPopa97]
+                                unchanged:
+                                    type: array
+                                    items:
+                                        type: string
+                                    example: []
+                                missing:
+                                    type: array
+                                    items:
+                                        type: string
+                                    example: []
+              400:
+                description: Returns if request is invalid
                 schema:
                     id:
                     properties:
                         msg:
                             type: string
-                            example: Users have not been modified.
+                            example: Invalid fields for users.
               403:
                 description: Returns if user does not have role ADMINISTRATOR
                 schema:
@@ -151,6 +294,8 @@ def admin_update_user():
                         msg:
                             type: string
                             example: Invalid role for request
+              429:
+                description: Returns if too many bulk requests are running or waiting, with a Retry-After header
               500:
                 description: Returns if something goes wrong with the sql query
                 schema:
@@ -168,6 +313,8 @@ def admin_update_user():
 
 @app.route("/api/admin/users", methods=['DELETE'])
 @jwt_required
+@admission_controlled
+@validate_request_body
 def admin_delete_user():
     """
             Endpoint for user deletion, using username as id
@@ -182,6 +329,7 @@ def admin_delete_user():
                 required: true
                 type: array
                 schema:
+                    required: [username]
                     id:
                     name:
                     type: array
@@ -189,9 +337,17 @@ def admin_delete_user():
                         username:
                             type: string
                             example: cosminPopa97
+              - name: async
+                in: query
+                type: string
+                enum: ['1']
+                required: false
+                description: Run the batch as a background job and return its id.
             responses:
               200:
                 description: Validates that user was deleted successfully.
+              202:
+                description: Returns the id of the background job when called with async=1.
                 schema:
                     id:
                     properties:
@@ -214,6 +370,8 @@ def admin_delete_user():
                         msg:
                             type: string
                             example: Invalid role for request
+              429:
+                description: Returns if too many bulk requests are running or waiting, with a Retry-After header
               500:
                 description: Returns if something goes wrong with the sql query
                 schema:
@@ -225,14 +383,125 @@ def admin_delete_user():
     """
     verify_administrator(get_jwt_identity())
     users = request.json
-    response, status_code = delete_users(users)
+    if request.args.get('async') == '1':
+        response, status_code = submit_job('delete_users', users)
+    else:
+        response, status_code = delete_users(users)
     return jsonify({"msg": response}), status_code
 
 
 @app.route("/api/admin/users", methods=['GET'])
 @jwt_required
 def admin_get_user():
+    """
+            Endpoint for listing users with their roles
+
+            Requires JWT authorization and user to be ADMIN
+
+            *Without limit or cursor every matching user is returned in msg. With either of them msg holds one page
+            of users ordered by id and the next_cursor to pass as cursor for the following page (null on the last
+            page).*
+            ---
+            parameters:
+              - name: conference_id
+                in: query
+                type: integer
+                required: false
+                description: Only users with a role in this conference
+              - name: role_id
+                in: query
+                type: integer
+                required: false
+                description: Only users with this role (in conference_id, when given)
+              - name: valid_account
+                in: query
+                type: integer
+                required: false
+                description: 1 for validated accounts, 0 for the others
+              - name: username_prefix
+                in: query
+                type: string
+                required: false
+              - name: limit
+                in: query
+                type: integer
+                required: false
+                description: Users per page
+              - name: cursor
+                in: query
+                type: string
+                required: false
+                description: next_cursor of the previous page
+            responses:
+              200:
+                description: Matching users, or one page of them.
+                schema:
+                    id:
+                    properties:
+                        msg:
+                            type: object
+                            properties:
+                                users:
+                                    type: array
+                                    items:
+                                        type: object
+                                    example: [{"id": 7, "username": "cosminPopa97", "first_name": "Cosmin",
+                                               "last_name": "Popa", "is_phd": 0, "educational_title": "Drd.",
+                                               "roles": [{"conference_id": 1, "role_id": 2}]}]
+                                next_cursor:
+                                    type: string
+              304:
+                description: Returns if the listing did not change since the ETag in If-None-Match
+              400:
+                description: Returns if a query parameter or the cursor is invalid
+              403:
+                description: Returns if user does not have role ADMINISTRATOR
+    """
     verify_administrator(get_jwt_identity())
-    users = request.json
-    response, status_code = get_users()
-    return jsonify({"msg": response}), status_code
+    try:
+        filters = {name: int(request.args[name]) if name in request.args else None
+                   for name in ('conference_id', 'role_id', 'valid_account')}
+        limit = None
+        paginated = 'limit' in request.args or 'cursor' in request.args
+        if paginated:
+            limit = min(int(request.args.get('limit', 100)), int(current_app.config.get('USER_PAGE_MAX_SIZE', 1000)))
+    except ValueError:
+        return jsonify({"msg": "Invalid query parameters."}), 400
+    if paginated and limit < 1:
+        return jsonify({"msg": "Invalid query parameters."}), 400
+    # a client that just wrote reads its own writes from the primary, past entries built from the replica
+    cache = get_response_cache('users') if not reads_pinned_to_writer() else None
+    cache_key = request.query_string
+    cached = cache.get(cache_key) if cache is not None else None
+    if cached is not None:
+        if request.if_none_match.contains_weak(cached.etag):
+            response = Response(status=304)
+        else:
+            response = Response(cached.body, mimetype='application/json')
+        response.set_etag(cached.etag)
+        return response
+    if cache is not None:
+        version, etag = cache.begin(cache_key)
+        if request.if_none_match.contains_weak(etag):
+            # issued by another worker for the same version, so the listing has not changed since
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+    result, status_code = get_users(username_prefix=request.args.get('username_prefix'), limit=limit,
+                                    cursor=request.args.get('cursor'), **filters)
+    if status_code != 200:
+        return jsonify({"msg": result}), status_code
+    users, page = result
+    chunks = json_msg_page_chunks(users, 'users', page) if paginated else json_msg_chunks(users)
+    if cache is None:
+        return stream_response(chunks, users.close)
+    response = stream_response(cache.tee(cache_key, version, etag, chunks), users.close)
+    response.set_etag(etag)
+    return response
+
+
+@app.route("/api/admin/users/cache", methods=['GET'])
+@jwt_required
+def admin_get_users_cache_stats():
+    verify_administrator(get_jwt_identity())
+    return jsonify({"msg": get_response_cache('users').stats()}), 200
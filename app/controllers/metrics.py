@@ -0,0 +1,25 @@
+from flask import Blueprint, Response
+
+from app.helpers.helpers_metrics import get_metrics
+
+app = Blueprint("metrics", __name__, url_prefix="")
+
+
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    """
+            Prometheus metrics for this process: request, SQL and MongoDB timings plus pool, cache and mail queue
+            statistics
+            ---
+            produces:
+              - text/plain
+            responses:
+              200:
+                description: Metrics in the Prometheus text exposition format.
+              404:
+                description: Returns if metrics are disabled with METRICS_ENABLED.
+    """
+    app_metrics = get_metrics()
+    if app_metrics is None:
+        return Response('Metrics are disabled.\n', status=404, mimetype='text/plain')
+    return Response(app_metrics.registry.render(), mimetype='text/plain; version=0.0.4')
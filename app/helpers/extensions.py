@@ -1,3 +1,10 @@
 from flask_pymongo import PyMongo
 
-mongo = PyMongo()
\ No newline at end of file
+from app.helpers.helpers_metrics import MongoCommandListener
+
+mongo = PyMongo()
+
+
+def init_mongo(app):
+    app_metrics = app.extensions.get('metrics')
+    mongo.init_app(app, event_listeners=[MongoCommandListener(app_metrics)] if app_metrics is not None else [])
@@ -0,0 +1,154 @@
+import functools
+import math
+import threading
+import time
+from collections import deque
+
+from flask import current_app, jsonify, request
+
+# capacity is in payload items; bcrypt makes user creation the most expensive of them. max_concurrency caps the
+# requests running at once, so many small ones cannot drain the MySQL pool
+default_admission_limits = {
+    'admin_user_management.admin_create_user': {'capacity': 1000, 'max_concurrency': 2},
+    'admin_user_management.admin_import_users': {'capacity': 1000, 'max_concurrency': 2},
+    'admin_user_management.admin_update_user': {'capacity': 5000},
+    'admin_user_management.admin_delete_user': {'capacity': 5000},
+}
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class WeightedLimiter:
+    def __init__(self, capacity, max_concurrency=4, queue_size=8, timeout=10.0):
+        self.capacity = capacity
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._in_use = 0
+        self._running = 0
+        self._waiting = deque()
+        self._lock = threading.Condition()
+        self._admitted = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._wait_time_total = 0.0
+        self._seconds_per_unit = 0.0
+
+    def _retry_after(self):
+        # time for the admitted and queued work to drain, from the recent cost of one unit of weight
+        backlog = self._in_use + sum(ticket[0] for ticket in self._waiting)
+        return max(1, math.ceil(self._seconds_per_unit * backlog / self.capacity))
+
+    def _fits(self, weight):
+        return self._in_use + weight <= self.capacity and self._running < self.max_concurrency
+
+    def acquire(self, weight):
+        # a request heavier than the whole capacity is admitted on its own instead of never
+        weight = max(1, min(weight, self.capacity))
+        started = time.monotonic()
+        with self._lock:
+            if self._waiting or not self._fits(weight):
+                if len(self._waiting) >= self.queue_size:
+                    self._rejected += 1
+                    raise AdmissionRejected('Too many requests are waiting, try again later.', self._retry_after())
+                ticket = [weight]
+                self._waiting.append(ticket)
+                try:
+                    # first in, first out, so a heavy request is not overtaken by lighter ones forever
+                    while self._waiting[0] is not ticket or not self._fits(weight):
+                        remaining = started + self.timeout - time.monotonic()
+                        if remaining <= 0:
+                            self._timeouts += 1
+                            raise AdmissionRejected(f'Request was not admitted within {self.timeout}s, try again '
+                                                    f'later.', self._retry_after())
+                        self._lock.wait(remaining)
+                finally:
+                    self._waiting.remove(ticket)
+                    self._lock.notify_all()
+            self._in_use += weight
+            self._running += 1
+            self._admitted += 1
+            self._wait_time_total += time.monotonic() - started
+        return weight
+
+    def release(self, weight, elapsed):
+        with self._lock:
+            self._in_use -= weight
+            self._running -= 1
+            self._seconds_per_unit = 0.8 * self._seconds_per_unit + 0.2 * elapsed / weight \
+                if self._seconds_per_unit else elapsed / weight
+            self._lock.notify_all()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'capacity': self.capacity,
+                'max_concurrency': self.max_concurrency,
+                'in_use': self._in_use,
+                'running': self._running,
+                'waiting': len(self._waiting),
+                'queue_size': self.queue_size,
+                'admitted': self._admitted,
+                'rejected': self._rejected,
+                'timeouts': self._timeouts,
+                'wait_time_total': self._wait_time_total,
+            }
+
+
+_limiter_lock = threading.Lock()
+
+
+def get_limiter(endpoint):
+    flask_app = current_app._get_current_object()
+    config = flask_app.config
+    if not config.get('ADMISSION_ENABLED', True):
+        return None
+    limiters = flask_app.extensions.setdefault('admission_limiters', {})
+    limiter = limiters.get(endpoint)
+    if limiter is None:
+        limits = config.get('ADMISSION_LIMITS', default_admission_limits).get(endpoint)
+        if limits is None:
+            return None
+        with _limiter_lock:
+            limiter = limiters.get(endpoint)
+            if limiter is None:
+                limiter = WeightedLimiter(int(limits['capacity']),
+                                          max_concurrency=int(limits.get('max_concurrency',
+                                                                         config.get('ADMISSION_MAX_CONCURRENCY', 4))),
+                                          queue_size=int(limits.get('queue_size',
+                                                                    config.get('ADMISSION_QUEUE_SIZE', 8))),
+                                          timeout=float(limits.get('timeout', config.get('ADMISSION_TIMEOUT', 10))))
+                limiters[endpoint] = limiter
+    return limiter
+
+
+def request_weight():
+    # async requests count as well: their items are validated and stored, and new users' passwords hashed, up front
+    if request.is_json:
+        body = request.get_json(silent=True)
+        return len(body) if isinstance(body, list) else 1
+    # uploaded files are weighed by size, a user row of a CSV or NDJSON file is about this long
+    return (request.content_length or 0) // int(current_app.config.get('ADMISSION_BYTES_PER_ITEM', 100)) or 1
+
+
+def admission_controlled(view):
+    @functools.wraps(view)
+    def admitted(*args, **kwargs):
+        limiter = get_limiter(request.endpoint)
+        if limiter is None:
+            return view(*args, **kwargs)
+        try:
+            weight = limiter.acquire(request_weight())
+        except AdmissionRejected as e:
+            return jsonify({"msg": str(e)}), 429, {'Retry-After': str(e.retry_after)}
+        started = time.monotonic()
+        try:
+            return view(*args, **kwargs)
+        finally:
+            limiter.release(weight, time.monotonic() - started)
+
+    return admitted
@@ -0,0 +1,150 @@
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask import current_app
+from pymongo.errors import PyMongoError
+
+from app.helpers.extensions import mongo
+
+logger = logging.getLogger(__name__)
+
+
+class _CacheEntry:
+    def __init__(self, version, etag, body, expires_at):
+        self.version = version
+        self.etag = etag
+        self.body = body
+        self.expires_at = expires_at
+
+
+class SharedVersion:
+    # a counter in MongoDB, so a write handled by any worker process invalidates the entries of all of them
+    def __init__(self, name):
+        self.counter_id = f'response_cache.{name}'
+
+    def current(self):
+        counter = mongo.db.counter.find_one({'_id': self.counter_id}, {'seq': 1})
+        return counter['seq'] if counter is not None else 0
+
+    def bump(self):
+        mongo.db.counter.update_one({'_id': self.counter_id}, {'$inc': {'seq': 1}}, upsert=True)
+
+
+class ResponseCache:
+    def __init__(self, ttl=30.0, max_entries=32, max_entry_bytes=64 * 1024 * 1024, shared_version=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_entry_bytes = max_entry_bytes
+        self.shared_version = shared_version
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._instance = uuid.uuid4().hex[:8]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _current_version(self):
+        if self.shared_version is None:
+            return self.version
+        try:
+            version = self.shared_version.current()
+        except PyMongoError:
+            # without the shared version nothing can be known to be current: serve and store nothing
+            return None
+        with self._lock:
+            if version != self.version:
+                self.version = version
+                self._entries.clear()
+        return version
+
+    def get(self, key):
+        version = self._current_version()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry.version != version or entry.expires_at < time.monotonic()):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def begin(self, key):
+        version = self._current_version()
+        if version is None:
+            # nothing is known to be current, so the ETag must never match
+            return None, uuid.uuid4().hex
+        # a shared version means the same data in every worker, so any of them can answer 304 for the ETag; a local
+        # one only counts writes in this process
+        scope = '' if self.shared_version is not None else f'{self._instance}-'
+        return version, f'{scope}{version}-{hashlib.sha1(key).hexdigest()}'
+
+    def put(self, key, version, etag, body):
+        # a write anywhere while the body was produced makes it stale before it is stored
+        if len(body) > self.max_entry_bytes or version is None or version != self._current_version():
+            return
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[key] = _CacheEntry(version, etag, body, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def tee(self, key, version, etag, chunks):
+        parts = []
+        size = 0
+        for chunk in chunks:
+            if parts is not None:
+                parts.append(chunk)
+                size += len(chunk)
+                if size > self.max_entry_bytes:
+                    parts = None
+            yield chunk
+        if parts is not None:
+            self.put(key, version, etag, ''.join(parts).encode('utf-8'))
+
+    def invalidate(self):
+        if self.shared_version is not None:
+            try:
+                self.shared_version.bump()
+            except PyMongoError as e:
+                logger.warning('Invalidating the response cache of other workers failed: %s', e)
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'version': self.version, 'entries': len(self._entries), 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+
+_cache_lock = threading.Lock()
+
+
+def get_response_cache(name):
+    app = current_app._get_current_object()
+    caches = app.extensions.setdefault('response_caches', {})
+    cache = caches.get(name)
+    if cache is None:
+        with _cache_lock:
+            cache = caches.get(name)
+            if cache is None:
+                config = app.config
+                cache = ResponseCache(ttl=float(config.get('RESPONSE_CACHE_TTL', 30)),
+                                      max_entries=int(config.get('RESPONSE_CACHE_MAX_ENTRIES', 32)),
+                                      max_entry_bytes=int(config.get('RESPONSE_CACHE_MAX_ENTRY_BYTES',
+                                                                     64 * 1024 * 1024)),
+                                      shared_version=SharedVersion(name) if config.get('RESPONSE_CACHE_SHARED', True)
+                                      else None)
+                caches[name] = cache
+    return cache
@@ -0,0 +1,117 @@
+import datetime
+import logging
+
+import pymongo
+from flask import current_app
+from pymongo.errors import PyMongoError
+
+from app.helpers.extensions import mongo
+
+logger = logging.getLogger(__name__)
+
+
+def _reserve_sequence(count):
+    counter = mongo.db.counter.find_one_and_update({'_id': 'change'}, {'$inc': {'seq': count}}, upsert=True,
+                                                   return_document=pymongo.ReturnDocument.AFTER)
+    return counter['seq'] - count + 1
+
+
+def _mark_lost(seq):
+    # cursors before a change that was not recorded would skip it silently, so they are answered with 410
+    mongo.db.counter.update_one({'_id': 'change_lost'}, {'$max': {'seq': seq}}, upsert=True)
+
+
+def _lost(since):
+    lost = mongo.db.counter.find_one({'_id': 'change_lost'})
+    return lost is not None and since < lost['seq']
+
+
+def record_changes(entity, op, keys):
+    keys = list(keys)
+    if not keys:
+        return
+    flask_app = current_app._get_current_object()
+    # a change that could not even be numbered takes an extra sequence number of the next one that can, which is
+    # never written and is marked lost
+    unnumbered = flask_app.extensions.get('change_feed_unnumbered', False)
+    try:
+        first = _reserve_sequence(len(keys) + unnumbered)
+    except PyMongoError as e:
+        flask_app.extensions['change_feed_unnumbered'] = True
+        logger.error('Numbering %d %s %s changes failed: %s', len(keys), entity, op, e)
+        return
+    try:
+        if unnumbered:
+            _mark_lost(first)
+            flask_app.extensions['change_feed_unnumbered'] = False
+            first += 1
+        now = datetime.datetime.utcnow()
+        mongo.db.change.insert_many([{'_id': first + offset, 'entity': entity, 'key': key, 'op': op, 'at': now}
+                                     for offset, key in enumerate(keys)], ordered=False)
+    except PyMongoError as e:
+        logger.error('Recording %d %s %s changes failed: %s', len(keys), entity, op, e)
+        try:
+            _mark_lost(first + len(keys) - 1)
+        except PyMongoError:
+            flask_app.extensions['change_feed_unnumbered'] = True
+
+
+def _settled(changes, since):
+    # sequence numbers are reserved before the records are inserted, so a fresh gap may still be filled by a
+    # concurrent writer; stop there instead of letting the cursor skip past it
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(
+        seconds=float(current_app.config.get('CHANGE_FEED_SETTLE_SECONDS', 5)))
+    settled = []
+    expected = since + 1
+    for change in changes:
+        if change['_id'] != expected and change['at'] > cutoff:
+            return settled, True
+        settled.append(change)
+        expected = change['_id'] + 1
+    return settled, False
+
+
+def _head():
+    last_settled = mongo.db.change.find_one(
+        {'at': {'$lte': datetime.datetime.utcnow() - datetime.timedelta(
+            seconds=float(current_app.config.get('CHANGE_FEED_SETTLE_SECONDS', 5)))}},
+        sort=[('_id', pymongo.DESCENDING)])
+    since = last_settled['_id'] if last_settled is not None else 0
+    settled, _ = _settled(mongo.db.change.find({'_id': {'$gt': since}}).sort('_id', pymongo.ASCENDING), since)
+    return settled[-1]['_id'] if settled else since
+
+
+def _expired(since):
+    oldest = mongo.db.change.find_one({}, sort=[('_id', pymongo.ASCENDING)])
+    if oldest is not None:
+        return since < oldest['_id'] - 1
+    counter = mongo.db.counter.find_one({'_id': 'change'})
+    return counter is not None and since < counter['seq']
+
+
+def list_changes(since=None, limit=1000):
+    if since is None:
+        return {'changes': [], 'next_cursor': str(_head()), 'has_more': False}, 200
+    try:
+        since = int(since)
+    except (TypeError, ValueError):
+        return 'Invalid cursor.', 400
+    if since < 0:
+        return 'Invalid cursor.', 400
+    if _lost(since):
+        return 'Changes after the cursor could not be recorded, reload the full data.', 410
+    if since > 0 and _expired(since):
+        return 'Cursor is older than the retained changes, reload the full data.', 410
+    found = list(mongo.db.change.find({'_id': {'$gt': since}}).sort('_id', pymongo.ASCENDING).limit(limit + 1))
+    settled, blocked = _settled(found[:limit], since)
+    changes = [{'seq': change['_id'], 'entity': change['entity'], 'key': change['key'], 'op': change['op']}
+               for change in settled]
+    return {'changes': changes, 'next_cursor': str(settled[-1]['_id'] if settled else since),
+            'has_more': blocked or len(found) > limit}, 200
+
+
+def ensure_change_indexes():
+    retention_days = current_app.config.get('CHANGE_FEED_RETENTION_DAYS', 7)
+    if retention_days:
+        mongo.db.change.create_index([('at', pymongo.ASCENDING)], name='at_ttl',
+                                     expireAfterSeconds=int(float(retention_days) * 86400))
@@ -0,0 +1,115 @@
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+compressible_mimetypes = {'application/json', 'text/plain', 'text/html', 'text/csv'}
+
+
+class _GzipStream:
+    def __init__(self, level):
+        # wbits 31 writes the gzip header and trailer around the deflate stream
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliStream:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+def _negotiate(accept_encodings):
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def _compress_chunks(chunks, stream, charset, flush_bytes):
+    pending = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(charset)
+            pending += len(chunk)
+            compressed = stream.compress(chunk)
+            # flush now and then so the client gets data while the body is still being produced
+            if pending >= flush_bytes:
+                compressed += stream.flush()
+                pending = 0
+            if compressed:
+                yield compressed
+        yield stream.finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def _weaken_etag(response):
+    # a compressed body is a different representation, so only a weak validator still applies
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+
+
+def init_compression(app):
+    if not app.config.get('COMPRESS_ENABLED', True):
+        return
+    min_size = int(app.config.get('COMPRESS_MIN_SIZE', 1024))
+    gzip_level = int(app.config.get('COMPRESS_LEVEL', 6))
+    brotli_quality = int(app.config.get('COMPRESS_BROTLI_QUALITY', 4))
+    flush_bytes = int(app.config.get('COMPRESS_STREAM_FLUSH_BYTES', 64 * 1024))
+    mimetypes = set(app.config.get('COMPRESS_MIMETYPES', compressible_mimetypes))
+
+    def new_stream(encoding):
+        return _BrotliStream(brotli_quality) if encoding == 'br' else _GzipStream(gzip_level)
+
+    @app.after_request
+    def compress_response(response):
+        if response.status_code == 304:
+            # keep the validator in line with the compressed 200 the client holds
+            if _negotiate(request.accept_encodings) is not None:
+                _weaken_etag(response)
+            return response
+        if response.status_code < 200 or response.status_code in (204, 206) or response.direct_passthrough \
+                or 'Content-Encoding' in response.headers or response.mimetype not in mimetypes:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = _negotiate(request.accept_encodings)
+        if encoding is None:
+            return response
+        if response.is_streamed:
+            response.response = _compress_chunks(response.response, new_stream(encoding), response.charset,
+                                                 flush_bytes)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < min_size:
+                return response
+            stream = new_stream(encoding)
+            response.set_data(stream.compress(data) + stream.finish())
+        response.headers['Content-Encoding'] = encoding
+        _weaken_etag(response)
+        return response
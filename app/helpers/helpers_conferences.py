@@ -1,9 +1,21 @@
+import base64
+import binascii
 import datetime
+import json
+import logging
 
 import pymysql
+from flask import current_app
+from pymongo import ASCENDING, DeleteMany, IndexModel, ReplaceOne
+from pymongo.errors import BulkWriteError
 
 from app.helpers.extensions import mongo
+from app.helpers.helpers_changes import record_changes
 from app.helpers.helpers_database import get_connection
+from app.helpers.helpers_schedule import find_conflicts, session_conference_field, session_end_field, \
+    session_interval, session_room_field, session_speakers_field, session_start_field
+
+logger = logging.getLogger(__name__)
 
 valid_conference_fields = {'title', 'country', 'location', 'start_date', 'end_date', 'path_to_description',
                            'path_to_logo'}
@@ -16,20 +28,19 @@ def create_conference(conference):
         country = conference['country']
         start_date = datetime.datetime.fromtimestamp(conference['start_date'])
         end_date = datetime.datetime.fromtimestamp(conference['end_date'])
-        conn = get_connection()
-        with conn.cursor(pymysql.cursors.DictCursor) as cur:
-            try:
-                cur.execute(
-                    'INSERT INTO conference(title, path_to_logo, location, path_to_description, country, start_date, '
-                    'end_date) '
-                    'VALUES(%s, %s, %s, %s, %s, %s, %s)', (title, "", location, "", country, start_date, end_date,))
-                conn.commit()
-                conn.close()
-                return f'Conference {title} created successfully.', 200
-            except Exception as e:
-                print(e)
-                conn.close()
-                return f'Something went wrong while creating conference {title}.', 500
+        with get_connection() as conn:
+            with conn.cursor(pymysql.cursors.DictCursor) as cur:
+                try:
+                    cur.execute(
+                        'INSERT INTO conference(title, path_to_logo, location, path_to_description, country, '
+                        'start_date, end_date) '
+                        'VALUES(%s, %s, %s, %s, %s, %s, %s)', (title, "", location, "", country, start_date, end_date,))
+                    conn.commit()
+                    record_changes('conference', 'create', [title])
+                    return f'Conference {title} created successfully.', 200
+                except Exception:
+                    logger.exception('Creating conference %s failed', title, extra={'conference': title})
+                    return f'Something went wrong while creating conference {title}.', 500
     except KeyError:
         return "Invalid fields for conference.", 400
 
@@ -45,60 +56,239 @@ def update_conference(conference):
         country = conference['country']
         start_date = datetime.datetime.fromtimestamp(conference['start_date'])
         end_date = datetime.datetime.fromtimestamp(conference['end_date'])
-        conn = get_connection()
-        with conn.cursor(pymysql.cursors.DictCursor) as cur:
-            try:
-                affected_rows = cur.execute('UPDATE conference '
-                                            'set '
-                                            'path_to_logo=%s,'
-                                            'location=%s,'
-                                            'path_to_description=%s,'
-                                            'country=%s,'
-                                            'start_date=%s,'
-                                            'end_date=%s '
-                                            'WHERE title=%s;',
-                                            (path_to_logo, location, path_to_description, country, start_date, end_date,
-                                             title,))
-                if affected_rows > 0:
-                    conn.commit()
-                    conn.close()
-                    return f'Conference {title} updated successfully.', 200
-                else:
-                    conn.close()
-                    return f'Conference {title} either does not exist or it has not been modified.', 204
-            except Exception as e:
-                print(e)
-                conn.close()
-                return f'Something went wrong while updating conference {title}.', 500
+        with get_connection() as conn:
+            with conn.cursor(pymysql.cursors.DictCursor) as cur:
+                try:
+                    affected_rows = cur.execute('UPDATE conference '
+                                                'set '
+                                                'path_to_logo=%s,'
+                                                'location=%s,'
+                                                'path_to_description=%s,'
+                                                'country=%s,'
+                                                'start_date=%s,'
+                                                'end_date=%s '
+                                                'WHERE title=%s;',
+                                                (path_to_logo, location, path_to_description, country, start_date,
+                                                 end_date, title,))
+                    if affected_rows > 0:
+                        conn.commit()
+                        record_changes('conference', 'update', [title])
+                        return f'Conference {title} updated successfully.', 200
+                    else:
+                        return f'Conference {title} either does not exist or it has not been modified.', 204
+                except Exception:
+                    logger.exception('Updating conference %s failed', title, extra={'conference': title})
+                    return f'Something went wrong while updating conference {title}.', 500
 
 
 def update_conference_sessions(sessions):
     if not isinstance(sessions, list):
         sessions = [sessions]
-    for session in sessions:
-        mongo.db.session.update({"eventId": session['eventId']}, session, True)
-    return "Sessions updated successfully", 200
+    result = _session_write_result()
+    operations = []
+    targets = []
+    incoming = []
+    for position, session in enumerate(sessions):
+        if not isinstance(session, dict) or 'eventId' not in session:
+            result['write_errors'].append({'index': position, 'eventId': None, 'errmsg': 'Session has no eventId.'})
+            continue
+        operations.append(ReplaceOne({'eventId': session['eventId']}, session, upsert=True))
+        targets.append((position, session['eventId']))
+        incoming.append((position, session))
+    rejected = _check_schedule_conflicts(incoming, result)
+    if rejected is not None:
+        return rejected, 409
+    _write_sessions(operations, targets, result)
+    _record_session_changes(targets, result)
+    if result['write_errors']:
+        return result, 207
+    return result, 200
+
+
+def replace_conference_schedule(conference_id, sessions):
+    if not isinstance(sessions, list):
+        return 'Sessions must be a list.', 400
+    if not all(isinstance(session, dict) and 'eventId' in session for session in sessions):
+        return 'Every session needs an eventId.', 400
+    result = _session_write_result()
+    result['unchanged_count'] = 0
+    stored = {session['eventId']: session
+              for session in mongo.db.session.find({session_conference_field: conference_id}, {'_id': 0})}
+    operations = []
+    targets = []
+    incoming_ids = set()
+    incoming = []
+    for position, session in enumerate(sessions):
+        session = dict(session, **{session_conference_field: conference_id})
+        incoming_ids.add(session['eventId'])
+        incoming.append((position, session))
+        if stored.get(session['eventId']) == session:
+            result['unchanged_count'] += 1
+            continue
+        operations.append(ReplaceOne({'eventId': session['eventId']}, session, upsert=True))
+        targets.append((position, session['eventId']))
+    removed_ids = [event_id for event_id in stored if event_id not in incoming_ids]
+    chunk_size = int(current_app.config.get('SESSION_BULK_CHUNK_SIZE', 1000))
+    for start in range(0, len(removed_ids), chunk_size):
+        operations.append(DeleteMany({'eventId': {'$in': removed_ids[start:start + chunk_size]},
+                                      session_conference_field: conference_id}))
+        targets.append((None, None))
+    # the request is the whole schedule of the conference, so nothing stored is left to clash with
+    rejected = _check_schedule_conflicts(incoming, result, stored=[])
+    if rejected is not None:
+        return rejected, 409
+    _write_sessions(operations, targets, result)
+    _record_session_changes(targets, result, removed_ids)
+    if result['write_errors']:
+        return result, 207
+    return result, 200
+
+
+def _record_session_changes(targets, result, removed_ids=()):
+    failed = {error['index'] for error in result['write_errors']}
+    record_changes('session', 'upsert', [event_id for position, event_id in targets
+                                         if position is not None and position not in failed])
+    if not any(position is None for position in failed):
+        record_changes('session', 'delete', removed_ids)
+
+
+def _stored_sessions_around(incoming):
+    windows = {}
+    for _, session in incoming:
+        interval = session_interval(session)
+        conference_id = session.get(session_conference_field)
+        if interval is None or isinstance(conference_id, (dict, list)):
+            continue
+        start, end = windows.get(conference_id, interval)
+        windows[conference_id] = (min(start, interval[0]), max(end, interval[1]))
+    if not windows:
+        return []
+    projection = {'_id': 0, 'eventId': 1, session_conference_field: 1, session_start_field: 1, session_end_field: 1,
+                  session_room_field: 1, session_speakers_field: 1}
+    return mongo.db.session.find({'$or': [{session_conference_field: conference_id,
+                                           session_start_field: {'$lt': end}, session_end_field: {'$gt': start}}
+                                          for conference_id, (start, end) in windows.items()]}, projection)
+
+
+def _check_schedule_conflicts(incoming, result, stored=None):
+    mode = current_app.config.get('SCHEDULE_CONFLICT_MODE', 'flag')
+    if mode == 'off':
+        return None
+    if stored is None:
+        stored = _stored_sessions_around(incoming)
+    conflicts, conflict_count = find_conflicts(incoming, stored,
+                                               limit=int(current_app.config.get('SCHEDULE_CONFLICT_LIMIT', 100)))
+    if mode == 'reject' and conflict_count:
+        return {'conflict_count': conflict_count, 'conflicts': conflicts}
+    result['conflict_count'] = conflict_count
+    result['conflicts'] = conflicts
+    return None
+
+
+def _session_write_result():
+    return {'matched_count': 0, 'upserted_count': 0, 'modified_count': 0, 'deleted_count': 0, 'write_errors': []}
+
+
+def _write_sessions(operations, targets, result):
+    chunk_size = int(current_app.config.get('SESSION_BULK_CHUNK_SIZE', 1000))
+    for start in range(0, len(operations), chunk_size):
+        try:
+            details = mongo.db.session.bulk_write(operations[start:start + chunk_size], ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            details = e.details
+        result['matched_count'] += details['nMatched']
+        result['upserted_count'] += details['nUpserted']
+        result['modified_count'] += details['nModified']
+        result['deleted_count'] += details['nRemoved']
+        for error in details['writeErrors']:
+            position, event_id = targets[start + error['index']]
+            result['write_errors'].append({'index': position, 'eventId': event_id, 'errmsg': error['errmsg']})
+
+
+def find_sessions(conference_id=None, start=None, end=None, fields=None, limit=100, cursor=None):
+    query = {}
+    if conference_id is not None:
+        query[session_conference_field] = conference_id
+    time_window = {}
+    if start is not None:
+        time_window['$gte'] = start
+    if end is not None:
+        time_window['$lt'] = end
+    if time_window:
+        query[session_start_field] = time_window
+    if cursor is not None:
+        try:
+            last_start, last_event_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (binascii.Error, ValueError, TypeError):
+            return 'Invalid cursor.', 400
+        query['$or'] = [{session_start_field: {'$gt': last_start}},
+                        {session_start_field: last_start, 'eventId': {'$gt': last_event_id}}]
+    projection = {'_id': 0}
+    if fields:
+        projection.update({field: 1 for field in fields})
+        projection.update({session_start_field: 1, 'eventId': 1})
+    found = list(mongo.db.session.find(query, projection)
+                 .sort([(session_start_field, ASCENDING), ('eventId', ASCENDING)])
+                 .limit(limit + 1))
+    next_cursor = None
+    if len(found) > limit:
+        found = found[:limit]
+        last = found[-1]
+        next_cursor = base64.urlsafe_b64encode(
+            json.dumps([last.get(session_start_field), last['eventId']]).encode()).decode()
+    return {'sessions': found, 'next_cursor': next_cursor}, 200
+
+
+def ensure_session_indexes():
+    mongo.db.session.create_indexes([
+        IndexModel([('eventId', ASCENDING)], unique=True, name='eventId_unique'),
+        IndexModel([(session_conference_field, ASCENDING), (session_start_field, ASCENDING), ('eventId', ASCENDING)],
+                   name='conference_start_event'),
+        IndexModel([(session_start_field, ASCENDING), ('eventId', ASCENDING)], name='start_event'),
+    ])
 
 
 def delete_session(event_id):
-    mongo.db.session.delete_one({"eventId": event_id})
+    if mongo.db.session.delete_one({"eventId": event_id}).deleted_count:
+        record_changes('session', 'delete', [event_id])
     return "", 204
 
 
+def delete_sessions(event_ids=None, conference_id=None):
+    if event_ids is not None:
+        if not isinstance(event_ids, list):
+            return 'eventIds must be a list.', 400
+        deleted_count = 0
+        deleted_ids = []
+        chunk_size = int(current_app.config.get('SESSION_BULK_CHUNK_SIZE', 1000))
+        for start in range(0, len(event_ids), chunk_size):
+            # only sessions that exist are deleted, and only those become changes
+            stored_ids = mongo.db.session.distinct('eventId', {'eventId': {'$in': event_ids[start:start + chunk_size]}})
+            if stored_ids:
+                deleted_count += mongo.db.session.delete_many({'eventId': {'$in': stored_ids}}).deleted_count
+                deleted_ids.extend(stored_ids)
+        record_changes('session', 'delete', deleted_ids)
+    elif conference_id is not None:
+        event_ids = mongo.db.session.distinct('eventId', {session_conference_field: conference_id})
+        deleted_count = mongo.db.session.delete_many({session_conference_field: conference_id}).deleted_count
+        record_changes('session', 'delete', event_ids)
+    else:
+        return 'Request needs eventId, eventIds or conferenceId.', 400
+    return {'deleted_count': deleted_count}, 200
+
+
 def delete_conference(conference):
     title = conference['title']
-    conn = get_connection()
-    with conn.cursor(pymysql.cursors.DictCursor) as cur:
-        try:
-            affected_rows = cur.execute('DELETE FROM conference WHERE title=%s;', (title,))
-            if affected_rows > 0:
-                conn.commit()
-            else:
-                conn.close()
-                return f'Conference {title} does not exist.', 404
-            conn.close()
-            return f'Conference {title} deleted successfully.', 200
-        except Exception as e:
-            print(e)
-            conn.close()
-            return f'Something went wrong while deleting conference {title}.', 500
+    with get_connection() as conn:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            try:
+                affected_rows = cur.execute('DELETE FROM conference WHERE title=%s;', (title,))
+                if affected_rows > 0:
+                    conn.commit()
+                    record_changes('conference', 'delete', [title])
+                else:
+                    return f'Conference {title} does not exist.', 404
+                return f'Conference {title} deleted successfully.', 200
+            except Exception:
+                logger.exception('Deleting conference %s failed', title, extra={'conference': title})
+                return f'Something went wrong while deleting conference {title}.', 500
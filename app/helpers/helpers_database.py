@@ -1,11 +1,331 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
 import pymysql
-from flask import current_app
+from flask import current_app, g, has_request_context, request
+from pymysql.constants import SERVER_STATUS
+
+from app.helpers.helpers_metrics import instrumented_connect
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class _PooledConnection:
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+
+
+class ConnectionPool:
+    def __init__(self, connect_args, min_size=1, max_size=10, idle_timeout=300, ping_on_checkout=True,
+                 max_lifetime=3600, checkout_timeout=10, connect=pymysql.connect):
+        self.connect_args = connect_args
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.ping_on_checkout = ping_on_checkout
+        self.max_lifetime = max_lifetime
+        self.checkout_timeout = checkout_timeout
+        self._idle = deque()
+        self._size = 0
+        self._in_use = 0
+        self._lock = threading.Condition()
+        self._checkouts = 0
+        self._handshakes = 0
+        self._handshakes_avoided = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._timeouts = 0
+        self._outages = 0
+        self._unavailable_until = 0.0
+        for _ in range(min_size):
+            pooled = self._open()
+            with self._lock:
+                self._idle.append(pooled)
+                self._size += 1
+
+    def _open(self):
+        conn = self.connect(**self.connect_args)
+        with self._lock:
+            self._handshakes += 1
+        return _PooledConnection(conn)
+
+    def _is_expired(self, pooled, now):
+        if self.max_lifetime and now - pooled.created_at > self.max_lifetime:
+            return True
+        return bool(self.idle_timeout) and now - pooled.last_used_at > self.idle_timeout and \
+            self._size > self.min_size
+
+    def _discard(self, pooled):
+        try:
+            pooled.conn.close()
+        except Exception:
+            pooled.conn._force_close()
+
+    def _pop_stale(self, now):
+        # idle connections are reused from the right end, so the least recently used ones collect at the left
+        stale = []
+        while self._idle and self._size > self.min_size and self._is_expired(self._idle[0], now):
+            stale.append(self._idle.popleft())
+            self._size -= 1
+        return stale
+
+    def checkout(self):
+        started = time.monotonic()
+        deadline = started + self.checkout_timeout
+        # closing sends COM_QUIT over the socket, so expired connections are closed once the lock is released
+        stale = []
+        try:
+            with self._lock:
+                while True:
+                    now = time.monotonic()
+                    stale.extend(self._pop_stale(now))
+                    while self._idle:
+                        pooled = self._idle.pop()
+                        if self._is_expired(pooled, now):
+                            self._size -= 1
+                            stale.append(pooled)
+                            continue
+                        break
+                    else:
+                        pooled = None
+                    if pooled is not None or self._size < self.max_size:
+                        if pooled is None:
+                            self._size += 1
+                        self._in_use += 1
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(f'No database connection available after {self.checkout_timeout}s.')
+                    self._lock.wait(remaining)
+                waited = time.monotonic() - started
+                self._checkouts += 1
+                self._wait_time_total += waited
+                self._wait_time_max = max(self._wait_time_max, waited)
+        finally:
+            for expired in stale:
+                self._discard(expired)
+        try:
+            if pooled is None:
+                return self._open()
+            if self.ping_on_checkout:
+                try:
+                    pooled.conn.ping(reconnect=False)
+                except pymysql.err.Error:
+                    self._discard(pooled)
+                    return self._open()
+            with self._lock:
+                self._handshakes_avoided += 1
+            return pooled
+        except Exception:
+            with self._lock:
+                self._size -= 1
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+
+    def release(self, pooled, broken=False):
+        if not broken:
+            try:
+                if pooled.conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                    pooled.conn.rollback()
+            except pymysql.err.Error:
+                broken = True
+        with self._lock:
+            self._in_use -= 1
+            now = time.monotonic()
+            if broken:
+                self._size -= 1
+                stale = [pooled]
+            else:
+                pooled.last_used_at = now
+                self._idle.append(pooled)
+                stale = []
+            stale.extend(self._pop_stale(now))
+            self._lock.notify()
+        for expired in stale:
+            self._discard(expired)
+
+    def available(self):
+        return time.monotonic() >= self._unavailable_until
+
+    def mark_unavailable(self, seconds):
+        with self._lock:
+            self._outages += 1
+            self._unavailable_until = time.monotonic() + seconds
+
+    def connection(self):
+        return self.lease(self.checkout())
+
+    @contextmanager
+    def lease(self, pooled):
+        try:
+            yield pooled.conn
+        except pymysql.err.OperationalError:
+            self.release(pooled, broken=True)
+            raise
+        except BaseException:
+            self.release(pooled)
+            raise
+        else:
+            self.release(pooled)
+
+    def close(self):
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+        for pooled in idle:
+            self._discard(pooled)
+
+    def abandon(self):
+        # a forked child shares these sockets with its parent: closing them cleanly would send COM_QUIT and end the
+        # parent's sessions, so only the child's file descriptors are dropped
+        with self._lock:
+            while self._idle:
+                self._size -= 1
+                self._idle.pop().conn._force_close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'max_size': self.max_size,
+                'checkouts': self._checkouts,
+                'handshakes': self._handshakes,
+                'handshakes_avoided': self._handshakes_avoided,
+                'wait_time_total': self._wait_time_total,
+                'wait_time_max': self._wait_time_max,
+                'timeouts': self._timeouts,
+                'outages': self._outages,
+            }
+
+
+def _pool_setting(config, reader, key, default=None):
+    # reader settings fall back to the writer's, so a replica usually only needs DB_READER_HOST
+    if reader and f'DB_READER_{key}' in config:
+        return config[f'DB_READER_{key}']
+    if default is None:
+        return config[f'DB_{key}']
+    return config.get(f'DB_{key}', default)
+
+
+def _create_pool(app, reader=False):
+    config = app.config
+    metrics = app.extensions.get('metrics')
+    connect_args = dict(host=_pool_setting(config, reader, 'HOST'),
+                        port=int(_pool_setting(config, reader, 'PORT')),
+                        user=_pool_setting(config, reader, 'USER'),
+                        passwd=_pool_setting(config, reader, 'PASS'),
+                        db=_pool_setting(config, reader, 'NAME'))
+    if reader:
+        connect_args['connect_timeout'] = float(config.get('DB_READER_CONNECT_TIMEOUT', 2))
+        # no eager connections, so an unreachable replica cannot stop the pool from being created
+        min_size = int(config.get('DB_READER_POOL_MIN_SIZE', 0))
+    else:
+        min_size = int(config.get('DB_POOL_MIN_SIZE', 1))
+    return ConnectionPool(connect_args,
+                          min_size=min_size,
+                          max_size=int(_pool_setting(config, reader, 'POOL_MAX_SIZE', 10)),
+                          idle_timeout=float(_pool_setting(config, reader, 'POOL_IDLE_TIMEOUT', 300)),
+                          ping_on_checkout=bool(_pool_setting(config, reader, 'POOL_PING', True)),
+                          max_lifetime=float(_pool_setting(config, reader, 'POOL_MAX_LIFETIME', 3600)),
+                          checkout_timeout=float(_pool_setting(config, reader, 'POOL_TIMEOUT', 10)),
+                          connect=instrumented_connect(metrics) if metrics is not None else pymysql.connect)
+
+
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    app = current_app._get_current_object()
+    pool = app.extensions.get('db_pool')
+    if pool is None:
+        with _pool_lock:
+            pool = app.extensions.get('db_pool')
+            if pool is None:
+                pool = _create_pool(app)
+                app.extensions['db_pool'] = pool
+    return pool
+
+
+def get_reader_pool():
+    app = current_app._get_current_object()
+    if not app.config.get('DB_READER_HOST'):
+        return None
+    pool = app.extensions.get('db_reader_pool')
+    if pool is None:
+        with _pool_lock:
+            pool = app.extensions.get('db_reader_pool')
+            if pool is None:
+                pool = _create_pool(app, reader=True)
+                app.extensions['db_reader_pool'] = pool
+    return pool
+
+
+def _read_your_writes_cookie():
+    return current_app.config.get('DB_READ_YOUR_WRITES_COOKIE', 'db_wrote_at')
+
+
+def reads_pinned_to_writer():
+    if not has_request_context():
+        return False
+    if g.get('db_wrote'):
+        return True
+    try:
+        wrote_at = float(request.cookies.get(_read_your_writes_cookie(), ''))
+    except ValueError:
+        return False
+    return time.time() - wrote_at < float(current_app.config.get('DB_READ_YOUR_WRITES_SECONDS', 5))
+
+
+def get_connection(readonly=False):
+    if not readonly:
+        if has_request_context():
+            g.db_wrote = True
+        return get_pool().connection()
+    reader = get_reader_pool()
+    if reader is not None and reader.available() and not reads_pinned_to_writer():
+        try:
+            return reader.lease(reader.checkout())
+        except pymysql.err.OperationalError as e:
+            current_app.logger.warning('Read replica unavailable, reading from the primary: %s', e)
+            reader.mark_unavailable(float(current_app.config.get('DB_READER_RETRY_SECONDS', 30)))
+    return get_pool().connection()
+
+
+def init_read_your_writes(app):
+    @app.after_request
+    def remember_writes(response):
+        if g.get('db_wrote') and app.config.get('DB_READER_HOST'):
+            seconds = float(app.config.get('DB_READ_YOUR_WRITES_SECONDS', 5))
+            response.set_cookie(_read_your_writes_cookie(), str(time.time()), max_age=max(int(seconds), 1),
+                                httponly=True)
+        return response
+
+
+def get_pool_stats():
+    pool = current_app.extensions.get('db_pool')
+    return pool.stats() if pool is not None else {}
+
+
+def get_bulk_chunk_size():
+    return int(current_app.config.get('DB_BULK_CHUNK_SIZE', 500))
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
 
 
-def get_connection():
-    port = int(current_app.config['DB_PORT'])
-    return pymysql.connect(host=current_app.config['DB_HOST'],
-                           port=port,
-                           user=current_app.config['DB_USER'],
-                           passwd=current_app.config['DB_PASS'],
-                           db=current_app.config['DB_NAME'])
+def in_placeholders(values):
+    return ', '.join(['%s'] * len(values))
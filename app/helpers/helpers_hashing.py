@@ -0,0 +1,108 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# the pool is started from a request thread while the log, mail, job and MongoDB threads run: a forked child would
+# inherit the locks they hold, so children come from a clean server process instead
+_start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def _hash_chunk(passwords):
+    from passlib.handlers.bcrypt import bcrypt
+    return [bcrypt.hash(password) for password in passwords]
+
+
+class PasswordHasher:
+    def __init__(self, workers, queue_size, chunk_size):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self._executor = self._new_executor() if workers > 0 else None
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._lock = threading.Lock()
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(_start_method))
+
+    def _replace_broken(self, executor):
+        with self._lock:
+            # another thread may have replaced it already
+            if self._executor is executor:
+                self._executor = self._new_executor()
+                executor.shutdown(wait=False)
+
+    def hash_many(self, passwords):
+        executor = self._executor
+        if executor is None:
+            return _hash_chunk(passwords)
+        try:
+            return self._hash_on(executor, passwords)
+        except BrokenProcessPool:
+            # a worker process died; without a new pool every later bulk create would fail until a restart
+            logger.warning('Password hashing pool is broken, starting a new one', extra={'workers': self.workers})
+            self._replace_broken(executor)
+            return self._hash_on(self._executor, passwords)
+
+    def _hash_on(self, executor, passwords):
+        futures = []
+        try:
+            for start in range(0, len(passwords), self.chunk_size):
+                # blocks while the queue is full, so large batches cannot flood the workers
+                self._slots.acquire()
+                try:
+                    future = executor.submit(_hash_chunk, passwords[start:start + self.chunk_size])
+                except Exception:
+                    self._slots.release()
+                    raise
+                future.add_done_callback(lambda _: self._slots.release())
+                futures.append(future)
+            hashes = []
+            for future in futures:
+                hashes.extend(future.result())
+            return hashes
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+_hasher_lock = threading.Lock()
+
+
+def _default_workers(app):
+    cpus = os.cpu_count() or 1
+    web_workers = app.extensions.get('web_workers')
+    if not web_workers:
+        return cpus
+    # forked web workers already run side by side, so each gets its share of the cores; never none, or a bulk create
+    # would hash on its request thread, and admission control caps how many hashing requests run at once
+    return max(1, cpus // web_workers)
+
+
+def get_password_hasher():
+    app = current_app._get_current_object()
+    hasher = app.extensions.get('password_hasher')
+    if hasher is None:
+        with _hasher_lock:
+            hasher = app.extensions.get('password_hasher')
+            if hasher is None:
+                workers = app.config.get('HASHING_WORKERS')
+                hasher = PasswordHasher(workers=int(workers) if workers is not None else _default_workers(app),
+                                        queue_size=int(app.config.get('HASHING_QUEUE_SIZE', 64)),
+                                        chunk_size=int(app.config.get('HASHING_CHUNK_SIZE', 8)))
+                app.extensions['password_hasher'] = hasher
+    return hasher
+
+
+def hash_passwords(passwords):
+    return get_password_hasher().hash_many(list(passwords))
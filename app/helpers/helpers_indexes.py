@@ -0,0 +1,27 @@
+import logging
+import threading
+
+from pymongo.errors import PyMongoError
+
+from app.helpers.helpers_changes import ensure_change_indexes
+from app.helpers.helpers_conferences import ensure_session_indexes
+from app.helpers.helpers_jobs import ensure_job_indexes
+
+logger = logging.getLogger(__name__)
+
+
+def ensure_indexes():
+    for ensure in (ensure_session_indexes, ensure_job_indexes, ensure_change_indexes):
+        try:
+            ensure()
+        except PyMongoError as e:
+            logger.warning('Ensuring MongoDB indexes failed in %s: %s', ensure.__name__, e)
+
+
+def provision_indexes(flask_app):
+    def provision():
+        with flask_app.app_context():
+            ensure_indexes()
+
+    # index builds are idempotent; run them off the startup path so an unreachable MongoDB does not block workers
+    threading.Thread(target=provision, name='mongo-indexes', daemon=True).start()
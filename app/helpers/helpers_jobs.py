@@ -0,0 +1,244 @@
+import base64
+import datetime
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pymongo
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from flask import current_app
+from pymongo.errors import DocumentTooLarge, PyMongoError
+
+from app.helpers.extensions import mongo
+from app.helpers.helpers_conferences import update_conference_sessions
+from app.helpers.helpers_user_management import create_hashed_users, delete_users, encrypt_new_user_passwords, \
+    hash_encrypted_user_passwords
+
+logger = logging.getLogger(__name__)
+
+job_functions = {
+    'create_users': create_hashed_users,
+    'delete_users': delete_users,
+    'update_conference_sessions': update_conference_sessions,
+}
+# run on the request thread before a job is stored, so no plain password reaches the job collection
+job_item_preparers = {
+    'create_users': encrypt_new_user_passwords,
+}
+# run by the job on each chunk before it is passed to the job function, so bcrypt stays off the request thread
+job_item_loaders = {
+    'create_users': hash_encrypted_user_passwords,
+}
+
+_ACTIVE_STATUSES = ['queued', 'running']
+
+
+class JobRunner:
+    def __init__(self, flask_app, workers=2, queue_size=100):
+        self.flask_app = flask_app
+        self.queue_size = queue_size
+        self.owner = uuid.uuid4().hex
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job-worker')
+        self._active = set()
+        self._lock = threading.Lock()
+
+    def submit(self, job_id):
+        with self._lock:
+            if job_id in self._active:
+                return True
+            if len(self._active) >= self.queue_size:
+                return False
+            self._active.add(job_id)
+        self._executor.submit(self._run, job_id)
+        return True
+
+    def _run(self, job_id):
+        try:
+            with self.flask_app.app_context():
+                _run_job(job_id, self.owner)
+        except Exception:
+            logger.exception('Job %s failed', job_id, extra={'job_id': job_id})
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+_runner_lock = threading.Lock()
+
+
+def get_job_runner():
+    flask_app = current_app._get_current_object()
+    runner = flask_app.extensions.get('job_runner')
+    if runner is None:
+        with _runner_lock:
+            runner = flask_app.extensions.get('job_runner')
+            if runner is None:
+                runner = JobRunner(flask_app, workers=int(flask_app.config.get('JOB_WORKERS', 2)),
+                                   queue_size=int(flask_app.config.get('JOB_QUEUE_SIZE', 100)))
+                flask_app.extensions['job_runner'] = runner
+    return runner
+
+
+def _job_cipher():
+    config = current_app.config
+    key = config.get('JOB_ENCRYPTION_KEY')
+    if key is None:
+        # every process that may resume the job shares the JWT secret, so they all derive the same key
+        key = base64.urlsafe_b64encode(HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b'job items',
+                                            backend=default_backend()).derive(config['JWT_SECRET_KEY'].encode()))
+    return Fernet(key)
+
+
+def submit_job(kind, items):
+    if not isinstance(items, list):
+        items = [items]
+    if kind in job_item_preparers:
+        items = job_item_preparers[kind](items, _job_cipher())
+        if items is None:
+            return 'Invalid fields for job items.', 400
+    now = datetime.datetime.utcnow()
+    job = {
+        '_id': uuid.uuid4().hex,
+        'kind': kind,
+        'status': 'queued',
+        'items': items,
+        'total': len(items),
+        'processed': 0,
+        'next_chunk': 0,
+        'chunk_size': int(current_app.config.get('JOB_CHUNK_SIZE', 200)),
+        'errors': [],
+        'owner': None,
+        'created_at': now,
+        'updated_at': now,
+        'heartbeat_at': now,
+    }
+    try:
+        mongo.db.job.insert_one(job)
+    except DocumentTooLarge:
+        return 'Payload is too large for an asynchronous job.', 413
+    if not get_job_runner().submit(job['_id']):
+        mongo.db.job.update_one({'_id': job['_id']}, {'$set': {'status': 'rejected', 'items': [],
+                                                               'expires_at': _expires_at()}})
+        return 'Too many jobs are queued, try again later.', 503
+    return {'job_id': job['_id']}, 202
+
+
+def _claim_job(job_id, owner):
+    now = datetime.datetime.utcnow()
+    stale = now - datetime.timedelta(seconds=float(current_app.config.get('JOB_STALE_SECONDS', 300)))
+    return mongo.db.job.find_one_and_update(
+        {'_id': job_id, 'status': {'$in': _ACTIVE_STATUSES},
+         '$or': [{'owner': None}, {'owner': owner}, {'heartbeat_at': {'$lt': stale}}]},
+        {'$set': {'owner': owner, 'status': 'running', 'heartbeat_at': now, 'updated_at': now}},
+        return_document=pymongo.ReturnDocument.AFTER)
+
+
+def _expires_at():
+    return datetime.datetime.utcnow() + datetime.timedelta(days=float(current_app.config.get('JOB_RETENTION_DAYS', 7)))
+
+
+def _load_chunk(kind, start, chunk):
+    if kind not in job_item_loaders:
+        return chunk, []
+    try:
+        return job_item_loaders[kind](chunk, _job_cipher()), []
+    except InvalidToken:
+        logger.error('Items %d-%d of a %s job could not be decrypted', start, start + len(chunk), kind)
+        msg = 'Job items could not be decrypted, the encryption key has changed.'
+    except Exception:
+        logger.exception('Preparing items %d-%d of a %s job failed', start, start + len(chunk), kind)
+        msg = 'Something went wrong while running the job.'
+    return None, [{'index': start + offset, 'status': 500, 'msg': msg} for offset in range(len(chunk))]
+
+
+def _run_chunk(function, kind, start, chunk):
+    try:
+        response, status_code = function(chunk)
+    except Exception:
+        logger.exception('Items %d-%d of a %s job failed', start, start + len(chunk), kind)
+        response, status_code = 'Something went wrong while running the job.', 500
+    if kind == 'update_conference_sessions' and isinstance(response, dict) and 'write_errors' in response:
+        return [dict(error, index=start + error['index']) for error in response['write_errors']]
+    if status_code < 400:
+        return []
+    if status_code < 500 and len(chunk) > 1:
+        # the helpers reject a whole batch for one bad item: halve it until the failing items are alone, so the
+        # others are still written and every error names its item
+        middle = len(chunk) // 2
+        return _run_chunk(function, kind, start, chunk[:middle]) + \
+            _run_chunk(function, kind, start + middle, chunk[middle:])
+    return [{'index': start + offset, 'status': status_code, 'msg': response} for offset in range(len(chunk))]
+
+
+def _run_job(job_id, owner):
+    job = _claim_job(job_id, owner)
+    if job is None:
+        return
+    function = job_functions[job['kind']]
+    items = job['items']
+    chunk_size = job['chunk_size']
+    for index in range(job['next_chunk'], (len(items) + chunk_size - 1) // chunk_size):
+        start = index * chunk_size
+        chunk = items[start:start + chunk_size]
+        loaded, errors = _load_chunk(job['kind'], start, chunk)
+        if loaded is not None:
+            errors = _run_chunk(function, job['kind'], start, loaded)
+        now = datetime.datetime.utcnow()
+        update = {'$inc': {'processed': len(chunk)},
+                  '$set': {'next_chunk': index + 1, 'heartbeat_at': now, 'updated_at': now}}
+        if errors:
+            update['$push'] = {'errors': {'$each': errors}}
+        if mongo.db.job.update_one({'_id': job_id, 'owner': owner}, update).matched_count == 0:
+            # another worker took the job over after this one went quiet
+            return
+        logger.debug('Job %s chunk %d finished with %d errors', job_id, index, len(errors),
+                     extra={'job_id': job_id, 'chunk': index, 'errors': len(errors)})
+    done = mongo.db.job.find_one({'_id': job_id}, {'errors': {'$slice': 1}})
+    status = 'completed_with_errors' if done['errors'] else 'completed'
+    mongo.db.job.update_one({'_id': job_id, 'owner': owner},
+                            {'$set': {'status': status, 'items': [], 'updated_at': datetime.datetime.utcnow(),
+                                      'expires_at': _expires_at()}})
+
+
+def ensure_job_indexes():
+    mongo.db.job.create_index([('status', pymongo.ASCENDING), ('heartbeat_at', pymongo.ASCENDING)],
+                              name='status_heartbeat')
+    # finished jobs are removed JOB_RETENTION_DAYS after they end; running ones have no expires_at
+    mongo.db.job.create_index('expires_at', name='expires_at_ttl', expireAfterSeconds=0)
+
+
+def get_job(job_id):
+    job = mongo.db.job.find_one({'_id': job_id}, {'items': 0, 'owner': 0})
+    if job is None:
+        return f'Job {job_id} does not exist.', 404
+    job['id'] = job.pop('_id')
+    return job, 200
+
+
+def resume_jobs(flask_app):
+    interval = float(flask_app.config.get('JOB_RESUME_INTERVAL', 60))
+
+    def resume():
+        while True:
+            with flask_app.app_context():
+                try:
+                    runner = get_job_runner()
+                    stale = datetime.datetime.utcnow() - datetime.timedelta(
+                        seconds=float(flask_app.config.get('JOB_STALE_SECONDS', 300)))
+                    for job in mongo.db.job.find({'status': {'$in': _ACTIVE_STATUSES},
+                                                  '$or': [{'owner': None}, {'heartbeat_at': {'$lt': stale}}]},
+                                                 {'_id': 1}):
+                        runner.submit(job['_id'])
+                except PyMongoError as e:
+                    logger.warning('Resuming jobs failed: %s', e)
+            time.sleep(interval)
+
+    threading.Thread(target=resume, name='job-resume', daemon=True).start()
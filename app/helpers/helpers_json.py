@@ -0,0 +1,128 @@
+import calendar
+import datetime
+import decimal
+import json
+import uuid
+
+from bson import ObjectId
+from flask import current_app
+from flask.json import JSONEncoder
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+json_backends = ('orjson', 'ujson', 'json')
+
+
+def _datetime_value(value, datetime_format):
+    if datetime_format == 'iso':
+        return value.isoformat()
+    if isinstance(value, datetime.datetime):
+        # naive values are taken as UTC, the same as Flask's own encoder
+        if datetime_format == 'timestamp':
+            return calendar.timegm(value.utctimetuple()) + value.microsecond / 1e6
+        return http_date(value.utctimetuple())
+    if datetime_format == 'timestamp':
+        return calendar.timegm(value.timetuple())
+    return http_date(value.timetuple())
+
+
+def _default_for(datetime_format):
+    def default(value):
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            return _datetime_value(value, datetime_format)
+        if isinstance(value, decimal.Decimal):
+            return float(value)
+        if isinstance(value, (uuid.UUID, ObjectId)):
+            return str(value)
+        if hasattr(value, '__html__'):
+            return str(value.__html__())
+        raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+    return default
+
+
+def _json_dumps(default):
+    def dumps(value, sort_keys=False, indent=None):
+        return json.dumps(value, default=default, sort_keys=sort_keys, indent=indent)
+
+    return dumps
+
+
+def _orjson_dumps(default):
+    # orjson would write datetimes itself; pass them through so every backend formats them the same way
+    base_options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+    fallback = _json_dumps(default)
+
+    def dumps(value, sort_keys=False, indent=None):
+        options = base_options
+        if sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(value, default=default, option=options).decode()
+        except TypeError:
+            # integers beyond 64 bits and the like
+            return fallback(value, sort_keys, indent)
+
+    return dumps
+
+
+def _ujson_dumps(default):
+    fallback = _json_dumps(default)
+
+    def dumps(value, sort_keys=False, indent=None):
+        try:
+            return ujson.dumps(value, default=default, sort_keys=sort_keys, indent=indent or 0,
+                               ensure_ascii=False, escape_forward_slashes=False)
+        except (TypeError, OverflowError):
+            return fallback(value, sort_keys, indent)
+
+    return dumps
+
+
+def make_dumps(backend='auto', datetime_format='http'):
+    default = _default_for(datetime_format)
+    if backend == 'auto':
+        backend = 'orjson' if orjson is not None else 'ujson' if ujson is not None else 'json'
+    if backend == 'orjson' and orjson is not None:
+        return 'orjson', _orjson_dumps(default)
+    if backend == 'ujson' and ujson is not None:
+        return 'ujson', _ujson_dumps(default)
+    if backend not in json_backends:
+        raise ValueError(f'Unknown JSON_BACKEND {backend!r}, expected auto or one of {", ".join(json_backends)}.')
+    return 'json', _json_dumps(default)
+
+
+def dumps(value, sort_keys=False, indent=None):
+    app_dumps = current_app.extensions.get('json_dumps') if current_app else None
+    if app_dumps is None:
+        return json.dumps(value, sort_keys=sort_keys, indent=indent)
+    return app_dumps(value, sort_keys, indent)
+
+
+class AppJSONEncoder(JSONEncoder):
+    dumps = staticmethod(_json_dumps(_default_for('http')))
+
+    def encode(self, o):
+        return self.dumps(o, self.sort_keys, self.indent)
+
+
+def init_json(app):
+    requested = app.config.get('JSON_BACKEND', 'auto')
+    backend, app_dumps = make_dumps(requested, app.config.get('JSON_DATETIME_FORMAT', 'http'))
+    if requested not in ('auto', backend):
+        app.logger.warning('JSON_BACKEND %s is not installed, using %s', requested, backend)
+    app.extensions['json_backend'] = backend
+    app.extensions['json_dumps'] = app_dumps
+    # flask.json can encode without an app context (the test client does), so the encoder carries its backend
+    app.json_encoder = type('AppJSONEncoder', (AppJSONEncoder,), {'dumps': staticmethod(app_dumps)})
@@ -0,0 +1,130 @@
+import atexit
+import datetime
+import json
+import logging
+import queue
+import random
+import sys
+import time
+import traceback
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+# attributes every LogRecord has; anything else on a record came in through extra= and is logged as a field
+_record_attributes = set(vars(logging.LogRecord('', logging.INFO, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.utcfromtimestamp(record.created).isoformat(timespec='milliseconds') + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'pid': record.process,
+            'message': record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _record_attributes)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    def __init__(self, debug_sample_rate=1.0):
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record):
+        if record.levelno < logging.INFO and self.debug_sample_rate < 1.0:
+            if random.random() >= self.debug_sample_rate:
+                return False
+            record.sample_rate = self.debug_sample_rate
+        # the listener thread has no request context, so it is captured on the thread that logs
+        if has_request_context() and 'request_id' in g:
+            record.request_id = g.request_id
+            record.method = request.method
+            record.path = request.path
+            record.elapsed_ms = round((time.perf_counter() - g.log_started_at) * 1000, 3)
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # render everything that cannot cross threads, but keep the traceback apart from the message
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = ''.join(traceback.format_exception(*record.exc_info)).rstrip('\n')
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # a full queue drops the record instead of stalling the request that logged it
+            self.dropped += 1
+
+
+def start_log_listener(app):
+    handler = app.extensions['log_handler']
+    handler.queue = queue.Queue(int(app.config.get('LOG_QUEUE_SIZE', 10000)))
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if app.config.get('LOG_FORMAT', 'json') == 'json' else logging.Formatter(
+        '%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    listener = QueueListener(handler.queue, output)
+    listener.start()
+    app.extensions['log_listener'] = listener
+    atexit.register(listener.stop)
+    return listener
+
+
+def init_logging(app):
+    app.logger.removeHandler(default_handler)
+    # app.logger is shared by every app of this package, a second create_app replaces the handler of the first
+    for existing in [h for h in app.logger.handlers if isinstance(h, NonBlockingQueueHandler)]:
+        app.logger.removeHandler(existing)
+    app.logger.setLevel(app.config.get('LOG_LEVEL', 'INFO'))
+    # records of the app.* module loggers reach this one, and are not written a second time by the root logger
+    app.logger.propagate = False
+    handler = NonBlockingQueueHandler(None)
+    handler.addFilter(RequestContextFilter(float(app.config.get('LOG_DEBUG_SAMPLE_RATE', 0.01))))
+    app.logger.addHandler(handler)
+    app.extensions['log_handler'] = handler
+    start_log_listener(app)
+
+    header = app.config.get('LOG_REQUEST_ID_HEADER', 'X-Request-ID')
+    log_requests = app.config.get('LOG_REQUESTS', True)
+
+    @app.before_request
+    def assign_request_id():
+        g.log_started_at = time.perf_counter()
+        g.request_id = request.headers.get(header) or uuid.uuid4().hex
+
+    @app.after_request
+    def log_request(response):
+        if 'request_id' not in g:
+            return response
+        response.headers[header] = g.request_id
+        if log_requests:
+            started = g.log_started_at
+            fields = {'status': response.status_code, 'endpoint': request.endpoint, 'request_id': g.request_id,
+                      'method': request.method, 'path': request.path}
+
+            def log_completed():
+                # after a streamed body there is no request context left, so the fields are passed explicitly
+                app.logger.info('%s %s %s', fields['method'], fields['path'], fields['status'],
+                                extra=dict(fields, elapsed_ms=round((time.perf_counter() - started) * 1000, 3)))
+
+            response.call_on_close(log_completed)
+        return response
@@ -0,0 +1,138 @@
+import atexit
+import logging
+import queue
+import smtplib
+import threading
+import time
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class MailQueue:
+    def __init__(self, flask_app, mail, workers=2, batch_size=50, max_retries=5, retry_backoff=1.0,
+                 queue_size=10000):
+        self.flask_app = flask_app
+        self.mail = mail
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.sent = 0
+        self.failed = 0
+        self._counter_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._workers = [threading.Thread(target=self._run, name=f'mail-worker-{i}', daemon=True)
+                         for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def put(self, messages):
+        for message in messages:
+            self._queue.put(message)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                message = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if message is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(message)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            with self.flask_app.app_context():
+                self._deliver(batch)
+
+    def _send(self, connection, message):
+        try:
+            connection.send(message)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+            # the server refused this message for good; the connection is still usable for the rest of the batch
+            if isinstance(e, smtplib.SMTPResponseException) and e.smtp_code < 500:
+                raise
+            logger.warning('Mail to %s was refused: %s', ', '.join(message.recipients), e)
+            with self._counter_lock:
+                self.failed += 1
+        else:
+            with self._counter_lock:
+                self.sent += 1
+
+    def _deliver(self, batch):
+        attempt = 0
+        while batch:
+            try:
+                with self.mail.connect() as connection:
+                    while batch:
+                        self._send(connection, batch[0])
+                        batch.pop(0)
+            except Exception:
+                attempt += 1
+                if attempt > self.max_retries:
+                    logger.exception('Sending mail failed after %d attempts, dropping %d messages', attempt,
+                                     len(batch), extra={'dropped': len(batch)})
+                    with self._counter_lock:
+                        self.failed += len(batch)
+                    return
+                time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+
+    def close(self, timeout=5.0):
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+
+
+_queue_lock = threading.Lock()
+
+
+def get_mail_queue():
+    flask_app = current_app._get_current_object()
+    mail_queue = flask_app.extensions.get('mail_queue')
+    if mail_queue is None:
+        with _queue_lock:
+            mail_queue = flask_app.extensions.get('mail_queue')
+            if mail_queue is None:
+                config = flask_app.config
+                # Flask-Mail is only imported once the first message is queued
+                from flask_mail import Mail
+                mail = Mail()
+                if 'mail' not in flask_app.extensions:
+                    mail.init_app(flask_app)
+                mail_queue = MailQueue(flask_app, mail,
+                                       workers=int(config.get('MAIL_WORKERS', 2)),
+                                       batch_size=int(config.get('MAIL_BATCH_SIZE', 50)),
+                                       max_retries=int(config.get('MAIL_MAX_RETRIES', 5)),
+                                       retry_backoff=float(config.get('MAIL_RETRY_BACKOFF', 1.0)),
+                                       queue_size=int(config.get('MAIL_QUEUE_SIZE', 10000)))
+                flask_app.extensions['mail_queue'] = mail_queue
+                atexit.register(mail_queue.close)
+    return mail_queue
+
+
+def queue_account_created_mail(usernames):
+    from flask_mail import Message
+    sender = current_app.config['MAIL_USERNAME']
+    messages = []
+    for username in usernames:
+        msg = Message(subject='Account created.', sender=sender, recipients=[username])
+        msg.body = "Your account has been created, download the conference application to activate your account!"
+        messages.append(msg)
+    get_mail_queue().put(messages)
@@ -0,0 +1,311 @@
+import bisect
+import logging
+import re
+import threading
+import time
+
+import pymysql
+from flask import current_app, g, request
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            lines.extend(f'{self.name}{_format_labels(key)} {value}' for key, value in self._values.items())
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (counts, total) in self._series.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{self.name}_bucket{_format_labels(key + (("le", le),))} {cumulative}')
+                lines.append(f'{self.name}_sum{_format_labels(key)} {total}')
+                lines.append(f'{self.name}_count{_format_labels(key)} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._gauges = []
+
+    def counter(self, name, documentation):
+        metric = Counter(name, documentation)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, documentation, collect):
+        self._gauges.append((name, documentation, collect))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, documentation, collect in self._gauges:
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} gauge')
+            for labels, value in collect():
+                lines.append(f'{name}{_format_labels(tuple(sorted(labels.items())))} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class AppMetrics:
+    def __init__(self, slow_query_seconds=None):
+        self.registry = MetricsRegistry()
+        self.slow_query_seconds = slow_query_seconds
+        self.request_seconds = self.registry.histogram('admin_http_request_duration_seconds',
+                                                       'Time spent handling requests, per endpoint.')
+        self.sql_seconds = self.registry.histogram('admin_sql_statement_duration_seconds',
+                                                   'Time spent executing SQL statements.')
+        self.sql_rows = self.registry.counter('admin_sql_statement_rows_total',
+                                              'Rows returned or affected by SQL statements.')
+        self.mongo_seconds = self.registry.histogram('admin_mongo_command_duration_seconds',
+                                                     'Time spent executing MongoDB commands.')
+        self.mongo_documents = self.registry.counter('admin_mongo_command_documents_total',
+                                                     'Documents returned or written by MongoDB commands.')
+        self.mongo_failures = self.registry.counter('admin_mongo_command_failures_total',
+                                                    'MongoDB commands that failed.')
+
+
+_VERB = re.compile(r'^\s*(\w+)')
+_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE(?: IF NOT EXISTS)?)\s+`?(\w+)', re.IGNORECASE)
+_PLACEHOLDER_RUN = re.compile(r'%s(?:\s*,\s*%s)+')
+
+
+def statement_label(query):
+    verb = _VERB.match(query)
+    table = _TABLE.search(query)
+    return f'{verb.group(1).upper() if verb else "?"} {table.group(1) if table else "-"}'
+
+
+def _value_shape(value):
+    if isinstance(value, (list, tuple)):
+        kinds = [type(item).__name__ for item in value]
+        if len(kinds) > 4 and len(set(kinds)) == 1:
+            return f'[{kinds[0]} x {len(kinds)}]'
+        return '(' + ', '.join(kinds) + ')'
+    if isinstance(value, dict):
+        return '{' + ', '.join(f'{key}: {type(item).__name__}' for key, item in value.items()) + '}'
+    return type(value).__name__
+
+
+def params_shape(args, many=False):
+    if args is None:
+        return 'none'
+    if many:
+        args = list(args)
+        return f'{len(args)} x {_value_shape(args[0]) if args else "()"}'
+    return _value_shape(args)
+
+
+class _InstrumentedCursorMixin:
+    _batch_depth = 0
+
+    def execute(self, query, args=None):
+        if self._batch_depth:
+            return super().execute(query, args)
+        started = time.perf_counter()
+        rows = super().execute(query, args)
+        self._record(query, args, False, time.perf_counter() - started, rows)
+        return rows
+
+    def executemany(self, query, args):
+        started = time.perf_counter()
+        self._batch_depth += 1
+        try:
+            rows = super().executemany(query, args)
+        finally:
+            self._batch_depth -= 1
+        self._record(query, args, True, time.perf_counter() - started, rows)
+        return rows
+
+    def _record(self, query, args, many, elapsed, rows):
+        metrics = self.connection.metrics
+        label = statement_label(query)
+        metrics.sql_seconds.observe(elapsed, statement=label)
+        # unbuffered cursors report an unknown row count until the result has been read
+        if rows is not None and 0 <= rows < 2 ** 63:
+            metrics.sql_rows.inc(rows, statement=label)
+        if metrics.slow_query_seconds is not None and elapsed >= metrics.slow_query_seconds:
+            logger.warning('Slow SQL statement (%.1f ms): %s params=%s', elapsed * 1000,
+                           _PLACEHOLDER_RUN.sub('%s, ...', ' '.join(query.split()))[:500],
+                           params_shape(args, many))
+
+
+_cursor_classes = {}
+
+
+def _instrumented_cursor_class(cursor_class):
+    instrumented = _cursor_classes.get(cursor_class)
+    if instrumented is None:
+        instrumented = type(f'Instrumented{cursor_class.__name__}', (_InstrumentedCursorMixin, cursor_class), {})
+        _cursor_classes[cursor_class] = instrumented
+    return instrumented
+
+
+class InstrumentedConnection(pymysql.connections.Connection):
+    metrics = None
+
+    def cursor(self, cursor=None):
+        return _instrumented_cursor_class(cursor or self.cursorclass)(self)
+
+
+def instrumented_connect(metrics):
+    def connect(**kwargs):
+        conn = InstrumentedConnection(**kwargs)
+        conn.metrics = metrics
+        return conn
+
+    return connect
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self._collections = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = event.command.get('collection')
+        self._collections[(event.connection_id, event.request_id)] = \
+            collection if isinstance(collection, str) else '-'
+
+    def succeeded(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), '-')
+        elapsed = event.duration_micros / 1e6
+        self.metrics.mongo_seconds.observe(elapsed, command=event.command_name, collection=collection)
+        if self.metrics.slow_query_seconds is not None and elapsed >= self.metrics.slow_query_seconds:
+            logger.warning('Slow MongoDB command (%.1f ms): %s on %s', elapsed * 1000, event.command_name,
+                           collection)
+        reply = event.reply
+        documents = reply.get('n')
+        if documents is None and 'cursor' in reply:
+            cursor = reply['cursor']
+            documents = len(cursor.get('firstBatch', cursor.get('nextBatch', ())))
+        if documents:
+            self.metrics.mongo_documents.inc(documents, command=event.command_name, collection=collection)
+
+    def failed(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), '-')
+        self.metrics.mongo_seconds.observe(event.duration_micros / 1e6, command=event.command_name,
+                                           collection=collection)
+        self.metrics.mongo_failures.inc(command=event.command_name, collection=collection)
+
+
+def get_metrics():
+    return current_app.extensions.get('metrics')
+
+
+def init_metrics(app):
+    if not app.config.get('METRICS_ENABLED', True):
+        return None
+    slow_query_ms = app.config.get('SLOW_QUERY_LOG_MS')
+    metrics = AppMetrics(slow_query_seconds=slow_query_ms / 1000.0 if slow_query_ms is not None else None)
+    app.extensions['metrics'] = metrics
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started_at = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        started = g.get('request_started_at')
+        if started is not None:
+            labels = {'endpoint': request.endpoint or 'unmatched', 'method': request.method,
+                      'status': response.status_code}
+            # a streamed body is produced after this hook, so the request ends when the server closes the response
+            response.call_on_close(lambda: metrics.request_seconds.observe(time.perf_counter() - started, **labels))
+        return response
+
+    def pool_stats():
+        samples = []
+        for role, extension in (('writer', 'db_pool'), ('reader', 'db_reader_pool')):
+            pool = app.extensions.get(extension)
+            if pool is not None:
+                samples.extend(({'pool': role, 'stat': key}, value) for key, value in pool.stats().items())
+        return samples
+
+    def cache_stats():
+        caches = app.extensions.get('response_caches', {})
+        return [({'cache': name, 'stat': key}, value)
+                for name, cache in list(caches.items()) for key, value in cache.stats().items()]
+
+    def mail_stats():
+        mail_queue = app.extensions.get('mail_queue')
+        if mail_queue is None:
+            return []
+        return [({'stat': 'pending'}, mail_queue.pending()), ({'stat': 'sent'}, mail_queue.sent),
+                ({'stat': 'failed'}, mail_queue.failed)]
+
+    def admission_stats():
+        limiters = app.extensions.get('admission_limiters', {})
+        return [({'endpoint': endpoint, 'stat': key}, value)
+                for endpoint, limiter in list(limiters.items()) for key, value in limiter.stats().items()]
+
+    def log_stats():
+        handler = app.extensions.get('log_handler')
+        if handler is None:
+            return []
+        return [({'stat': 'pending'}, handler.queue.qsize()), ({'stat': 'dropped'}, handler.dropped)]
+
+    metrics.registry.gauge('admin_db_pool', 'MySQL connection pool statistics.', pool_stats)
+    metrics.registry.gauge('admin_response_cache', 'Response cache statistics.', cache_stats)
+    metrics.registry.gauge('admin_mail_queue', 'Outgoing mail queue statistics.', mail_stats)
+    metrics.registry.gauge('admin_admission', 'Admission control of bulk endpoints, weights in payload items.',
+                           admission_stats)
+    metrics.registry.gauge('admin_log_queue', 'Log records waiting for the log writer thread, and dropped ones.',
+                           log_stats)
+    return metrics
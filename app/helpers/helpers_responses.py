@@ -0,0 +1,42 @@
+import itertools
+
+from flask import Response, current_app, stream_with_context
+
+from app.helpers.helpers_json import dumps
+
+
+def json_array_items(items):
+    # encoding a few hundred items per call keeps per-call overhead and the number of chunks down
+    batch_size = int(current_app.config.get('JSON_STREAM_BATCH_SIZE', 256))
+    items = iter(items)
+    separator = ''
+    while True:
+        batch = list(itertools.islice(items, batch_size))
+        if not batch:
+            return
+        yield separator + dumps(batch)[1:-1]
+        separator = ','
+
+
+def json_msg_chunks(items):
+    yield '{"msg": ['
+    yield from json_array_items(items)
+    yield ']}'
+
+
+def json_msg_page_chunks(items, field, page):
+    yield '{"msg": {' + dumps(field) + ': ['
+    yield from json_array_items(items)
+    # the cursor is only known once every item of the page has been read
+    yield '], "next_cursor": ' + dumps(page['next_cursor']) + '}}'
+
+
+def stream_response(chunks, on_close=None):
+    response = Response(stream_with_context(chunks), mimetype='application/json')
+    if on_close is not None:
+        response.call_on_close(on_close)
+    return response
+
+
+def stream_json_msg(items):
+    return stream_response(json_msg_chunks(items), getattr(items, 'close', None))
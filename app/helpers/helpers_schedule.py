@@ -0,0 +1,79 @@
+import heapq
+import itertools
+import numbers
+
+session_conference_field = 'conferenceId'
+session_start_field = 'startTime'
+session_end_field = 'endTime'
+session_room_field = 'room'
+session_speakers_field = 'speakers'
+conflict_modes = {'reject', 'flag', 'off'}
+
+
+def session_interval(session):
+    start = session.get(session_start_field)
+    end = session.get(session_end_field)
+    for value in (start, end):
+        if not isinstance(value, numbers.Real) or isinstance(value, bool):
+            return None
+    if end <= start:
+        return None
+    return start, end
+
+
+def _resources(session):
+    room = session.get(session_room_field)
+    if isinstance(room, (str, int)) and not isinstance(room, bool) and room != '':
+        yield 'room', room
+    speakers = session.get(session_speakers_field)
+    if isinstance(speakers, str):
+        speakers = [speakers]
+    if isinstance(speakers, list):
+        for speaker in {speaker for speaker in speakers if isinstance(speaker, str) and speaker}:
+            yield 'speaker', speaker
+
+
+def _add_to_timelines(timelines, sessions, incoming):
+    for position, session in sessions:
+        interval = session_interval(session)
+        conference_id = session.get(session_conference_field)
+        if interval is None or isinstance(conference_id, (dict, list)):
+            continue
+        for kind, resource in _resources(session):
+            timelines.setdefault((kind, conference_id, resource), []).append(
+                (interval[0], interval[1], incoming, position, session['eventId']))
+
+
+def find_conflicts(incoming, stored=(), limit=100):
+    # the last copy of an eventId in the batch is the one that gets written
+    latest = {}
+    for position, session in incoming:
+        if not isinstance(session['eventId'], (dict, list)):
+            latest[session['eventId']] = (position, session)
+    timelines = {}
+    _add_to_timelines(timelines, latest.values(), True)
+    _add_to_timelines(timelines, ((None, session) for session in stored if session.get('eventId') not in latest),
+                      False)
+
+    conflicts = []
+    conflict_count = 0
+    for (kind, conference_id, resource), entries in timelines.items():
+        entries.sort(key=lambda entry: (entry[0], entry[1]))
+        # sessions still running at the current start time, keyed by their end time
+        active_incoming = []
+        active_stored = []
+        for order, entry in enumerate(entries):
+            start, end, is_incoming = entry[0], entry[1], entry[2]
+            for active in (active_incoming, active_stored):
+                while active and active[0][0] <= start:
+                    heapq.heappop(active)
+            # stored sessions were conflict free already, only pairs with an incoming session matter
+            overlapping = (active_incoming, active_stored) if is_incoming else (active_incoming,)
+            conflict_count += sum(len(active) for active in overlapping)
+            room_left = limit - len(conflicts)
+            for _, _, other in itertools.islice(itertools.chain(*overlapping), max(room_left, 0)):
+                conflicts.append({'type': kind, 'resource': resource, session_conference_field: conference_id,
+                                  'sessions': [{'index': other[3], 'eventId': other[4]},
+                                               {'index': entry[3], 'eventId': entry[4]}]})
+            heapq.heappush(active_incoming if is_incoming else active_stored, (end, order, entry))
+    return conflicts, conflict_count
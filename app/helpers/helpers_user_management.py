@@ -1,140 +1,402 @@
 import base64
+import binascii
+import csv
+import json
+import logging
 
 import pymysql
 from flask import current_app
-from flask_mail import Message, Mail
-from passlib.handlers.bcrypt import bcrypt
 
-from app.helpers.helpers_database import get_connection
-import app
+from app.helpers.helpers_cache import get_response_cache
+from app.helpers.helpers_changes import record_changes
+from app.helpers.helpers_database import get_connection, get_bulk_chunk_size, chunked, in_placeholders
+from app.helpers.helpers_hashing import hash_passwords
+from app.helpers.helpers_mail import queue_account_created_mail
+
+logger = logging.getLogger(__name__)
+
+required_user_fields = {'username', 'password', 'first_name', 'last_name', 'valid_account', 'is_phd',
+                        'educational_title', 'roles', 'conference_id'}
+hashed_user_fields = required_user_fields - {'password'}
+updatable_user_fields = ('username', 'first_name', 'last_name', 'valid_account', 'is_phd', 'educational_title')
 
 
 def create_users(users):
-    conn = get_connection()
-    with conn.cursor(pymysql.cursors.DictCursor) as cur:
-        try:
-            if not isinstance(users, list):
-                users = [users]
-            email_list = []
-            for user in users:
-                username = user['username']
-                password = bcrypt.encrypt(base64.b64decode(user['password']).decode("utf-8"))
-                first_name = user['first_name']
-                last_name = user['last_name']
-                valid_account = user['valid_account']
-                is_phd = user['is_phd']
-                educational_title = user['educational_title']
-                roles = user['roles']
-                conference_id = user['conference_id']
-                cur.execute(
-                    'INSERT INTO user(username, password, first_name, last_name, valid_account, is_phd,'
-                    ' educational_title, is_active) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)',
-                    (username, password, first_name, last_name, valid_account, is_phd, educational_title, 0,))
+    if not isinstance(users, list):
+        users = [users]
+    if not all(isinstance(user, dict) and required_user_fields.issubset(user.keys()) for user in users):
+        return 'Invalid fields for users.', 400
+    try:
+        passwords = hash_passwords(base64.b64decode(user['password']).decode("utf-8") for user in users)
+    except (TypeError, ValueError):
+        return 'Invalid fields for users.', 400
+    return _create_users(users, passwords)
+
+
+def encrypt_new_user_passwords(users, cipher):
+    # background jobs are stored in MongoDB, so their items carry the password encrypted; it is hashed by the job
+    if not all(isinstance(user, dict) and required_user_fields.issubset(user.keys()) for user in users):
+        return None
+    try:
+        passwords = [base64.b64decode(user['password']).decode("utf-8") for user in users]
+    except (TypeError, ValueError):
+        return None
+    return [dict({key: value for key, value in user.items() if key != 'password'},
+                 password_encrypted=cipher.encrypt(password.encode("utf-8")).decode('ascii'))
+            for user, password in zip(users, passwords)]
+
+
+def hash_encrypted_user_passwords(users, cipher):
+    hashes = hash_passwords(cipher.decrypt(user['password_encrypted'].encode('ascii')).decode("utf-8")
+                            for user in users)
+    return [dict({key: value for key, value in user.items() if key != 'password_encrypted'},
+                 password_hash=password_hash)
+            for user, password_hash in zip(users, hashes)]
+
+
+def create_hashed_users(users):
+    if not all(isinstance(user, dict) and 'password_hash' in user and hashed_user_fields.issubset(user.keys())
+               for user in users):
+        return 'Invalid fields for users.', 400
+    return _create_users(users, [user['password_hash'] for user in users])
+
+
+def _create_users(users, passwords):
+    usernames = [user['username'] for user in users]
+    chunk_size = get_bulk_chunk_size()
+    with get_connection() as conn:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            try:
+                collisions = _duplicate_usernames(usernames) | _find_existing_usernames(cur, usernames, chunk_size)
+                if collisions:
+                    return f'Usernames already exist: {", ".join(sorted(collisions))}.', 400
+                _insert_users(cur, users, passwords, chunk_size)
                 conn.commit()
-                cur.execute('SELECT LAST_INSERT_ID()')
-                user_id = cur.fetchone()['LAST_INSERT_ID()']
-                for role in roles:
-                    cur.execute(
-                        'INSERT INTO conference_user_role(conference_id, user_id, role_id) values (%s, %s, %s)',
-                        (conference_id, user_id, role,)
-                    )
+                get_response_cache('users').invalidate()
+                record_changes('user', 'create', usernames)
+            except pymysql.err.IntegrityError as e:
+                logger.warning('Creating users hit a duplicate key, checking for existing usernames: %s', e,
+                               extra={'users': len(usernames)})
+                conn.rollback()
+                collisions = _find_existing_usernames(cur, usernames, chunk_size)
+                if collisions:
+                    return f'Usernames already exist: {", ".join(sorted(collisions))}.', 400
+                return f'Something went wrong while creating users.', 500
+            except Exception:
+                logger.exception('Creating users failed', extra={'users': len(usernames)})
+                return f'Something went wrong while creating users.', 500
+    queue_account_created_mail(usernames)
+    return f'Users created successfully.', 200
+
+
+def _duplicate_usernames(usernames):
+    seen = set()
+    duplicates = set()
+    for username in usernames:
+        if username in seen:
+            duplicates.add(username)
+        seen.add(username)
+    return duplicates
+
+
+def _find_existing_usernames(cur, usernames, chunk_size):
+    existing = set()
+    for chunk in chunked(usernames, chunk_size):
+        cur.execute(f'SELECT username FROM user WHERE username IN ({in_placeholders(chunk)})', chunk)
+        existing.update(row['username'] for row in cur.fetchall())
+    return existing
+
+
+def _insert_users(cur, users, passwords, chunk_size):
+    for user_chunk, password_chunk in zip(chunked(users, chunk_size), chunked(passwords, chunk_size)):
+        cur.executemany(
+            'INSERT INTO user(username, password, first_name, last_name, valid_account, is_phd,'
+            ' educational_title, is_active) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)',
+            [(user['username'], password, user['first_name'], user['last_name'], user['valid_account'],
+              user['is_phd'], user['educational_title'], 0) for user, password in zip(user_chunk, password_chunk)])
+        usernames = [user['username'] for user in user_chunk]
+        cur.execute(f'SELECT id, username FROM user WHERE username IN ({in_placeholders(usernames)})', usernames)
+        user_ids = {row['username']: row['id'] for row in cur.fetchall()}
+        role_rows = [(user['conference_id'], user_ids[user['username']], role)
+                     for user in user_chunk for role in user['roles']]
+        if role_rows:
+            cur.executemany('INSERT INTO conference_user_role(conference_id, user_id, role_id) values (%s, %s, %s)',
+                            role_rows)
+
+
+def import_users(stream, file_format):
+    if file_format == 'csv':
+        rows = _csv_rows(stream)
+    elif file_format == 'ndjson':
+        rows = _ndjson_rows(stream)
+    else:
+        return 'Unsupported import format, expected csv or ndjson.', 400
+    summary = {'inserted': 0, 'duplicates': [], 'invalid': []}
+    chunk = []
+    chunk_size = int(current_app.config.get('USER_IMPORT_CHUNK_SIZE', get_bulk_chunk_size()))
+    try:
+        for line, row in rows:
+            user, error = _parse_import_row(row)
+            if error is not None:
+                summary['invalid'].append({'line': line, 'error': error})
+                continue
+            chunk.append((line, user))
+            if len(chunk) == chunk_size:
+                _import_chunk(chunk, summary)
+                chunk = []
+        if chunk:
+            _import_chunk(chunk, summary)
+    except (UnicodeDecodeError, csv.Error) as e:
+        summary['error'] = f'Import stopped, the file could not be parsed: {e}'
+        return summary, 400
+    except Exception:
+        logger.exception('Importing users failed', extra={'inserted': summary['inserted']})
+        summary['error'] = 'Something went wrong while importing users.'
+        return summary, 500
+    return summary, 200
+
+
+def _csv_rows(stream):
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _ndjson_rows(stream):
+    for line, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        try:
+            yield line, json.loads(text)
+        except ValueError:
+            yield line, None
+
+
+def _parse_import_row(row):
+    if not isinstance(row, dict):
+        return None, 'Row is not a valid object.'
+    missing = required_user_fields - {key for key, value in row.items() if value not in (None, '')}
+    if missing:
+        return None, f'Missing fields: {", ".join(sorted(missing))}.'
+    try:
+        roles = row['roles']
+        if isinstance(roles, str):
+            roles = [role for role in roles.split(';') if role.strip()]
+        user = {
+            'username': str(row['username']).strip(),
+            'password': base64.b64decode(row['password']).decode("utf-8"),
+            'first_name': row['first_name'],
+            'last_name': row['last_name'],
+            'valid_account': int(row['valid_account']),
+            'is_phd': int(row['is_phd']),
+            'educational_title': row['educational_title'],
+            'conference_id': int(row['conference_id']),
+            'roles': [int(role) for role in roles],
+        }
+    except (TypeError, ValueError):
+        return None, 'Invalid field values.'
+    return user, None
+
+
+def _import_chunk(chunk, summary):
+    seen = set()
+    candidates = []
+    for line, user in chunk:
+        if user['username'] in seen:
+            summary['duplicates'].append({'line': line, 'username': user['username']})
+        else:
+            seen.add(user['username'])
+            candidates.append((line, user))
+    if not candidates:
+        return
+    hashes = hash_passwords(user['password'] for _, user in candidates)
+    passwords = {user['username']: password for (_, user), password in zip(candidates, hashes)}
+    with get_connection() as conn:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            for attempt in range(2):
+                existing = _find_existing_usernames(cur, [user['username'] for _, user in candidates], len(candidates))
+                users = [user for _, user in candidates if user['username'] not in existing]
+                if not users:
+                    break
+                try:
+                    _insert_users(cur, users, [passwords[user['username']] for user in users], len(users))
                     conn.commit()
-                email_list.append(username)
-            conn.close()
-            msg = Message(subject='Account created.', sender=current_app.config['MAIL_USERNAME'], recipients=email_list)
-            msg.body = "Your account has been created, download the conference application to activate your account!"
-            app.mail.send(msg)
-            return f'Users created successfully.', 200
-        except Exception as e:
-            print(e)
-            conn.close()
-            if 'Duplicate' in e.args[1]:
-                return f'Username already exists.', 400
-            return f'Something went wrong while creating users.', 500
+                    break
+                except pymysql.err.IntegrityError:
+                    # another request inserted one of these usernames after the lookup; look again once
+                    conn.rollback()
+                    if attempt:
+                        raise
+    summary['duplicates'].extend({'line': line, 'username': user['username']}
+                                 for line, user in candidates if user['username'] in existing)
+    summary['inserted'] += len(users)
+    if users:
+        get_response_cache('users').invalidate()
+        record_changes('user', 'create', [user['username'] for user in users])
+        queue_account_created_mail([user['username'] for user in users])
 
 
 def update_users(users):
-    conn = get_connection()
-    with conn.cursor(pymysql.cursors.DictCursor) as cur:
-        try:
-            if not isinstance(users, list):
-                users = [users]
-            affected_rows = [0] * len(users)
-            for user in users:
-                username = user['username']
-                first_name = user['first_name']
-                last_name = user['last_name']
-                valid_account = user['valid_account']
-                is_phd = user['is_phd']
-                educational_title = user['educational_title']
-                affected_rows[users.index(user)] = cur.execute('UPDATE user '
-                                                               'set '
-                                                               'first_name=%s,'
-                                                               'last_name=%s,'
-                                                               'valid_account=%s,'
-                                                               'is_phd=%s,'
-                                                               'educational_title=%s '
-                                                               'WHERE username=%s;',
-                                                               (first_name, last_name, valid_account, is_phd,
-                                                                educational_title, username,))
-            if 0 not in affected_rows:
+    if not isinstance(users, list):
+        users = [users]
+    try:
+        staged = {user['username']: tuple(user[field] for field in updatable_user_fields) for user in users}
+    except (KeyError, TypeError):
+        return 'Invalid fields for users.', 400
+    chunk_size = get_bulk_chunk_size()
+    with get_connection() as conn:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            try:
+                # copied from user, so the staged values keep its column types, charset and collation and the join
+                # can use its unique index on username
+                cur.execute('DROP TEMPORARY TABLE IF EXISTS user_update_staging')
+                cur.execute('CREATE TEMPORARY TABLE user_update_staging (PRIMARY KEY (username)) '
+                            'SELECT username, first_name, last_name, valid_account, is_phd, educational_title '
+                            'FROM user LIMIT 0')
+                for chunk in chunked(list(staged.values()), chunk_size):
+                    cur.executemany('INSERT INTO user_update_staging(username, first_name, last_name, valid_account, '
+                                    'is_phd, educational_title) VALUES (%s, %s, %s, %s, %s, %s)', chunk)
+                cur.execute('SELECT s.username FROM user_update_staging s '
+                            'LEFT JOIN user u ON u.username = s.username WHERE u.id IS NULL')
+                missing = {row['username'] for row in cur.fetchall()}
+                cur.execute('SELECT s.username FROM user_update_staging s '
+                            'JOIN user u ON u.username = s.username '
+                            'WHERE u.first_name <=> s.first_name '
+                            'AND u.last_name <=> s.last_name '
+                            'AND u.valid_account <=> s.valid_account '
+                            'AND u.is_phd <=> s.is_phd '
+                            'AND u.educational_title <=> s.educational_title')
+                unchanged = {row['username'] for row in cur.fetchall()}
+                cur.execute('UPDATE user u JOIN user_update_staging s ON u.username = s.username '
+                            'set '
+                            'u.first_name=s.first_name,'
+                            'u.last_name=s.last_name,'
+                            'u.valid_account=s.valid_account,'
+                            'u.is_phd=s.is_phd,'
+                            'u.educational_title=s.educational_title')
                 conn.commit()
-                conn.close()
-                return f'Users updated successfully.', 200
-            else:
-                conn.close()
-                return f'Users either do not exist or have not been modified.', 204
-        except Exception as e:
-            print(e)
-            conn.close()
-            return f'Something went wrong while updating users.', 500
+                get_response_cache('users').invalidate()
+                record_changes('user', 'update', [username for username in staged
+                                                  if username not in missing and username not in unchanged])
+                cur.execute('DROP TEMPORARY TABLE user_update_staging')
+            except Exception:
+                logger.exception('Updating users failed', extra={'users': len(staged)})
+                return f'Something went wrong while updating users.', 500
+    outcomes = {'updated': [], 'unchanged': [], 'missing': []}
+    for username in staged:
+        if username in missing:
+            outcomes['missing'].append(username)
+        elif username in unchanged:
+            outcomes['unchanged'].append(username)
+        else:
+            outcomes['updated'].append(username)
+    return outcomes, 200
 
 
 def delete_users(users):
-    conn = get_connection()
-    with conn.cursor(pymysql.cursors.DictCursor) as cur:
-        try:
-            if not isinstance(users, list):
-                users = [users]
-            affected_rows = [0] * len(users)
-            for user in users:
-                username = user['username']
-                cur.execute(
-                    'SELECT id FROM conference_user_role WHERE user_id = (SELECT id FROM user WHERE username=%s)',
-                    (username,))
-                ids = cur.fetchall()
-                for id_object in ids:
-                    conf_user_role_id = id_object['id']
-                    cur.execute('DELETE FROM conference_user_role WHERE id=%s', (conf_user_role_id,))
-                conn.commit()
-                affected_rows[users.index(user)] = cur.execute('DELETE FROM user WHERE username=%s;', (username,))
-            if 0 not in affected_rows:
+    if not isinstance(users, list):
+        users = [users]
+    try:
+        usernames = list(dict.fromkeys(user['username'] for user in users))
+    except (KeyError, TypeError):
+        return 'Invalid fields for users.', 400
+    chunk_size = get_bulk_chunk_size()
+    with get_connection() as conn:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            try:
+                user_ids = {}
+                for chunk in chunked(usernames, chunk_size):
+                    cur.execute(f'SELECT id, username FROM user WHERE username IN ({in_placeholders(chunk)})', chunk)
+                    user_ids.update((row['username'], row['id']) for row in cur.fetchall())
+                missing = [username for username in usernames if username not in user_ids]
+                if missing:
+                    return f'Given users do not exist: {", ".join(missing)}.', 404
+                ids = list(user_ids.values())
+                for chunk in chunked(ids, chunk_size):
+                    cur.execute(f'DELETE FROM conference_user_role WHERE user_id IN ({in_placeholders(chunk)})', chunk)
+                    cur.execute(f'DELETE FROM user WHERE id IN ({in_placeholders(chunk)})', chunk)
                 conn.commit()
-                conn.close()
+                get_response_cache('users').invalidate()
+                record_changes('user', 'delete', usernames)
                 return f'Users deleted successfully.', 200
-            else:
-                conn.close()
-                return f'Given users do not exist.', 404
-        except Exception as e:
-            print(e)
-            conn.close()
-            return f'Something went wrong while deleting users.', 500
-
-
-def get_users():
-    conn = get_connection()
-    with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            except Exception:
+                logger.exception('Deleting users failed', extra={'users': len(usernames)})
+                return f'Something went wrong while deleting users.', 500
+
+
+def get_users(conference_id=None, role_id=None, valid_account=None, username_prefix=None, limit=None, cursor=None):
+    after_id = 0
+    if cursor is not None:
         try:
-            users = []
-            cur.execute('SELECT id, username, first_name, last_name, is_phd, educational_title FROM user')
-            users = cur.fetchall()
-            for user in users:
-                cur.execute('SELECT conference_id, role_id FROM conference_user_role WHERE user_id=%s', (user['id'],))
-                roles = cur.fetchall()
-                user['roles'] = roles
-            conn.close()
-            return users, 200
-        except Exception as e:
-            print(e)
-            conn.close()
-            return "Database error.", 500
+            after_id, = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            after_id = int(after_id)
+        except (binascii.Error, ValueError, TypeError):
+            return 'Invalid cursor.', 400
+    conditions = []
+    params = []
+    if conference_id is not None or role_id is not None:
+        role_conditions = []
+        if conference_id is not None:
+            role_conditions.append('f.conference_id = %s')
+            params.append(conference_id)
+        if role_id is not None:
+            role_conditions.append('f.role_id = %s')
+            params.append(role_id)
+        conditions.append('u.id IN (SELECT f.user_id FROM conference_user_role f '
+                          f'WHERE {" AND ".join(role_conditions)})')
+    if valid_account is not None:
+        conditions.append('u.valid_account = %s')
+        params.append(valid_account)
+    if username_prefix:
+        conditions.append("u.username LIKE %s ESCAPE '!'")
+        params.append(username_prefix.replace('!', '!!').replace('%', '!%').replace('_', '!_') + '%')
+    if after_id:
+        conditions.append('u.id > %s')
+        params.append(after_id)
+    page = {'next_cursor': None}
+    users = _iter_users(conditions, params, limit, page)
+    try:
+        next(users)
+    except Exception:
+        logger.exception('Listing users failed')
+        return "Database error.", 500
+    return (users, page), 200
+
+
+def _iter_users(conditions, params, limit, page):
+    columns = ('SELECT u.id, u.username, u.first_name, u.last_name, u.is_phd, u.educational_title, '
+               'r.conference_id, r.role_id ')
+    if conditions or limit is not None:
+        # pick the page of user ids first, so LIMIT counts users rather than user/role rows
+        selected = f'SELECT u.id FROM user u WHERE {" AND ".join(conditions) or "1 = 1"} ORDER BY u.id'
+        if limit is not None:
+            selected += ' LIMIT %s'
+            params = params + [limit + 1]
+        query = (columns + f'FROM ({selected}) page JOIN user u ON u.id = page.id '
+                           'LEFT JOIN conference_user_role r ON r.user_id = u.id ORDER BY u.id')
+    else:
+        query = columns + 'FROM user u LEFT JOIN conference_user_role r ON r.user_id = u.id ORDER BY u.id'
+    with get_connection(readonly=True) as conn:
+        with conn.cursor(pymysql.cursors.SSDictCursor) as cur:
+            cur.execute(query, params)
+            # the first step only runs the query, so errors surface before the response starts streaming
+            yield
+            user = None
+            count = 0
+            for row in cur:
+                if user is None or user['id'] != row['id']:
+                    if user is not None:
+                        yield user
+                        count += 1
+                    if count == limit:
+                        # the extra id fetched past the page only tells that there is a next one
+                        page['next_cursor'] = base64.urlsafe_b64encode(json.dumps([user['id']]).encode()).decode()
+                        user = None
+                        break
+                    user = {key: row[key] for key in ('id', 'username', 'first_name', 'last_name', 'is_phd',
+                                                      'educational_title')}
+                    user['roles'] = []
+                if row['role_id'] is not None:
+                    user['roles'].append({'conference_id': row['conference_id'], 'role_id': row['role_id']})
+            if user is not None:
+                yield user
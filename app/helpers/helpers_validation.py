@@ -0,0 +1,115 @@
+import functools
+import threading
+
+import yaml
+from flask import current_app, jsonify, request
+
+# docstring types that are not JSON schema types; flags like valid_account are sent as 0/1 as often as booleans
+docstring_types = {'timestamp': 'number', 'bool': ['boolean', 'integer']}
+copied_keywords = {'required', 'enum', 'additionalProperties', 'minimum', 'maximum', 'minLength', 'maxLength',
+                   'pattern', 'minItems', 'maxItems'}
+
+
+def _json_schema(schema):
+    converted = {}
+    for key, value in schema.items():
+        if key == 'type':
+            converted['type'] = docstring_types.get(value, value)
+        elif key == 'properties':
+            converted['properties'] = {name: _json_schema(field or {}) for name, field in value.items()}
+        elif key == 'items':
+            converted['items'] = _json_schema(value or {})
+        elif key in copied_keywords:
+            converted[key] = value
+    if 'properties' in converted and 'type' not in converted:
+        converted['type'] = 'object'
+    return converted
+
+
+def _body_schema(docstring):
+    if not docstring or '---' not in docstring:
+        return None
+    spec = yaml.load(docstring.split('---', 1)[1], Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader)) or {}
+    for parameter in spec.get('parameters') or []:
+        if parameter.get('in') == 'body' and parameter.get('schema'):
+            schema = parameter['schema']
+            # "type: array" next to properties documents endpoints taking one object or an array of them
+            if schema.get('type') == 'array' and 'properties' in schema:
+                return _json_schema(dict(schema, type='object')), True
+            return _json_schema(schema), False
+    return None
+
+
+def request_schemas(flask_app):
+    schemas = {}
+    for endpoint, view in flask_app.view_functions.items():
+        body_schema = _body_schema(view.__doc__)
+        if body_schema is not None:
+            schemas[endpoint] = body_schema
+    return schemas
+
+
+def build_request_schemas(flask_app, prebuilt=None):
+    # a prebuilt spec carries the schemas of the same docstrings, which saves parsing the YAML again
+    if prebuilt is not None:
+        schemas = {endpoint: (schema, many) for endpoint, (schema, many) in prebuilt.items()}
+    else:
+        schemas = request_schemas(flask_app)
+    flask_app.extensions['request_schemas'] = schemas
+    flask_app.extensions['request_validators'] = {}
+    return schemas
+
+
+_validator_lock = threading.Lock()
+
+
+def _get_validator(flask_app, endpoint):
+    validators = flask_app.extensions['request_validators']
+    validator = validators.get(endpoint)
+    if validator is None:
+        with _validator_lock:
+            validator = validators.get(endpoint)
+            if validator is None:
+                # jsonschema takes ~0.1s to import, so it is loaded with the first validated request
+                from jsonschema import Draft7Validator
+                schema, many = flask_app.extensions['request_schemas'][endpoint]
+                validator = (Draft7Validator(schema), many)
+                validators[endpoint] = validator
+    return validator
+
+
+def compile_validators(flask_app):
+    for endpoint in flask_app.extensions.get('request_schemas', {}):
+        _get_validator(flask_app, endpoint)
+
+
+def _item_errors(validator, item, index):
+    return [{'index': index, 'field': '.'.join(str(part) for part in error.absolute_path) or None,
+             'error': error.message}
+            for error in sorted(validator.iter_errors(item), key=lambda error: list(error.absolute_path))]
+
+
+def body_errors(flask_app, endpoint, body):
+    validator, many = _get_validator(flask_app, endpoint)
+    if many and isinstance(body, list):
+        errors = []
+        for index, item in enumerate(body):
+            errors.extend(_item_errors(validator, item, index))
+        return errors
+    return _item_errors(validator, body, None)
+
+
+def validate_request_body(view):
+    @functools.wraps(view)
+    def validated(*args, **kwargs):
+        flask_app = current_app._get_current_object()
+        if request.endpoint in flask_app.extensions.get('request_schemas', {}):
+            body = request.get_json(silent=True)
+            if body is None:
+                return jsonify({"msg": "Request body must be JSON."}), 400
+            errors = body_errors(flask_app, request.endpoint, body)
+            if errors:
+                return jsonify({"msg": "Request body does not match the schema.", "errors": errors}), 400
+        return view(*args, **kwargs)
+
+    return validated
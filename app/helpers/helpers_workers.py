@@ -0,0 +1,50 @@
+import importlib
+import os
+
+from app.helpers.extensions import init_mongo
+from app.helpers.helpers_indexes import provision_indexes
+from app.helpers.helpers_jobs import resume_jobs
+from app.helpers.helpers_logging import start_log_listener
+from app.helpers.helpers_validation import compile_validators
+
+# created lazily by the helpers and tied to the process that created them through threads, executors or sockets
+process_extensions = ('db_pool', 'db_reader_pool', 'mail_queue', 'job_runner', 'password_hasher',
+                      'admission_limiters')
+preloaded_modules = ('flask_mail', 'passlib.handlers.bcrypt', 'jsonschema')
+
+
+def start_background_tasks(app):
+    if app.config.get('MONGO_ENSURE_INDEXES', True):
+        provision_indexes(app)
+    if app.config.get('JOB_RESUME_ON_STARTUP', True):
+        resume_jobs(app)
+
+
+def preload_for_workers(app):
+    # whatever is imported or built here is shared copy-on-write by the forked workers
+    for module in preloaded_modules:
+        importlib.import_module(module)
+    compile_validators(app)
+    app.extensions['worker_pid'] = None
+
+    @app.before_first_request
+    def init_unforked_worker():
+        # servers without a post-fork hook, or a preloaded app served without forking
+        init_worker(app)
+
+
+def init_worker(app, web_workers=None):
+    if app.extensions.get('worker_pid') == os.getpid():
+        return
+    app.extensions['worker_pid'] = os.getpid()
+    app.extensions['web_workers'] = web_workers or app.config.get('WEB_WORKERS')
+    if 'log_handler' in app.extensions:
+        # the listener thread does not survive the fork; records go to a new queue drained by the worker's own
+        start_log_listener(app)
+    for extension in process_extensions:
+        resource = app.extensions.pop(extension, None)
+        if extension in ('db_pool', 'db_reader_pool') and resource is not None:
+            resource.abandon()
+    # the parent's client is dropped without close(), which would end its sessions over the shared sockets
+    init_mongo(app)
+    start_background_tasks(app)
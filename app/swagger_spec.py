@@ -0,0 +1,111 @@
+"""Prebuilt OpenAPI spec for the admin API.
+
+Building the spec with flasgger means importing it (and jsonschema) and parsing every YAML docstring on each
+cold start. The spec only changes when those docstrings do, so it can be generated once::
+
+    python -m app.swagger_spec --output swagger.json
+
+and served from ``SWAGGER_SPEC_FILE``. The artifact records a hash of the docstrings it was built from; the
+command is a no-op while the hash still matches, and ``create_app`` falls back to flasgger when it does not.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+from flask import Flask, jsonify
+
+spec_url = '/apispec_1.json'
+docstrings_hash_field = 'x-docstrings-hash'
+request_schemas_field = 'x-request-schemas'
+
+
+def docstrings_hash(flask_app):
+    digest = hashlib.sha256()
+    for endpoint in sorted(flask_app.view_functions):
+        if endpoint == 'static' or endpoint.startswith('flasgger.') or endpoint == 'apispec':
+            continue
+        digest.update(endpoint.encode())
+        digest.update(b'\0')
+        digest.update((flask_app.view_functions[endpoint].__doc__ or '').encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def build_spec():
+    from flasgger import Swagger
+    from app import register_blueprints
+    from app.helpers.helpers_validation import request_schemas
+    flask_app = Flask('app')
+    register_blueprints(flask_app)
+    Swagger(flask_app)
+    response = flask_app.test_client().get(spec_url)
+    if response.status_code != 200:
+        raise RuntimeError(f'flasgger answered {response.status_code} while building the spec')
+    spec = response.get_json()
+    spec[docstrings_hash_field] = docstrings_hash(flask_app)
+    spec[request_schemas_field] = request_schemas(flask_app)
+    return spec
+
+
+def _read_spec(path):
+    try:
+        with open(path) as spec_file:
+            return json.load(spec_file)
+    except (OSError, ValueError):
+        return None
+
+
+def load_prebuilt_spec(flask_app, path):
+    spec = _read_spec(path)
+    if spec is None:
+        flask_app.logger.warning('Swagger spec %s is missing or unreadable, building it with flasgger', path)
+        return None
+    if spec.get(docstrings_hash_field) != docstrings_hash(flask_app):
+        flask_app.logger.warning('Swagger spec %s is out of date, run `python -m app.swagger_spec --output %s`',
+                                 path, path)
+        return None
+    return spec
+
+
+def serve_prebuilt_spec(flask_app, spec):
+    served = {key: value for key, value in spec.items() if key != request_schemas_field}
+    flask_app.add_url_rule(spec_url, 'apispec', lambda: jsonify(served))
+
+
+def init_api_docs(flask_app):
+    path = flask_app.config.get('SWAGGER_SPEC_FILE')
+    spec = load_prebuilt_spec(flask_app, path) if path else None
+    if spec is not None:
+        serve_prebuilt_spec(flask_app, spec)
+        return spec
+    from flasgger import Swagger
+    Swagger(flask_app)
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Regenerate the prebuilt Swagger spec when the docstrings change.')
+    parser.add_argument('--output', default='swagger.json')
+    parser.add_argument('--force', action='store_true', help='rebuild even if the docstrings are unchanged')
+    args = parser.parse_args(argv)
+
+    if not args.force:
+        from app import register_blueprints
+        current = _read_spec(args.output)
+        flask_app = Flask('app')
+        register_blueprints(flask_app)
+        if current is not None and current.get(docstrings_hash_field) == docstrings_hash(flask_app):
+            print(f'{args.output} is up to date', file=sys.stderr)
+            return
+    spec = build_spec()
+    tmp_path = f'{args.output}.tmp'
+    with open(tmp_path, 'w') as output:
+        json.dump(spec, output, indent=2, sort_keys=True)
+    os.replace(tmp_path, args.output)
+    print(f'wrote {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
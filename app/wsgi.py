@@ -0,0 +1,11 @@
+"""WSGI entry point for pre-forking servers.
+
+    gunicorn -c gunicorn.conf.py app.wsgi:application
+
+The app is built once in the master with ``create_app(preload=True)``, so imports, the Swagger spec and the request
+validators are shared by the workers. Each worker then calls ``init_worker`` (the ``post_fork`` hook in
+``gunicorn.conf.py``) to open its own MongoDB client and MySQL pools and start its own background threads.
+"""
+from app import create_app
+
+application = create_app(preload=True)
@@ -0,0 +1,254 @@
+"""Reproducible benchmarks for the admin API hot paths.
+
+Drives the app built by ``create_app`` through its test client, with mongomock standing in for MongoDB and mail
+delivery suppressed. MySQL is either the in-process SQLite fake from ``fake_mysql`` (default) or a scratch
+MySQL/MariaDB database configured through ``BENCH_DB_HOST``/``BENCH_DB_PORT``/``BENCH_DB_USER``/``BENCH_DB_PASS``/
+``BENCH_DB_NAME`` with ``--mysql``; its user tables are emptied between scenarios.
+
+    python -m benchmarks.bench_admin_api --output bench_results.json
+    python -m benchmarks.bench_admin_api --output new.json --compare bench_results.json
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import mongomock
+import pymysql
+
+from benchmarks.fake_mysql import FakeDatabase
+
+# a well-formed bcrypt hash; seeded users never log in, so they skip hashing
+SEED_PASSWORD_HASH = '$2b$12$8rUSbqOA4Ek3VwSaMv7ZWe2dAYFLzlcOLS6M0oNdFjvWmlSNM2DhW'
+SCHEMA_FILE = os.path.join(os.path.dirname(__file__), 'schema.sql')
+
+
+class FakeBackend:
+    name = 'sqlite-fake'
+
+    def __init__(self):
+        self.db = FakeDatabase()
+
+    def install(self, flask_app):
+        import app.helpers.helpers_conferences as helpers_conferences
+        import app.helpers.helpers_user_management as helpers_user_management
+        helpers_conferences.get_connection = self.db.connection
+        helpers_user_management.get_connection = self.db.connection
+
+    def execute(self, query, args=()):
+        self.db.execute(query, args)
+
+    def executemany(self, query, rows):
+        self.db.executemany(query, rows)
+
+
+class MySQLBackend:
+    name = 'mysql'
+
+    def __init__(self):
+        self.config = {
+            'DB_HOST': os.environ.get('BENCH_DB_HOST', 'localhost'),
+            'DB_PORT': int(os.environ.get('BENCH_DB_PORT', 3306)),
+            'DB_USER': os.environ.get('BENCH_DB_USER', 'root'),
+            'DB_PASS': os.environ.get('BENCH_DB_PASS', ''),
+            'DB_NAME': os.environ.get('BENCH_DB_NAME', 'licenta_bench'),
+        }
+        self.conn = pymysql.connect(host=self.config['DB_HOST'], port=self.config['DB_PORT'],
+                                    user=self.config['DB_USER'], passwd=self.config['DB_PASS'],
+                                    db=self.config['DB_NAME'], autocommit=True)
+        with open(SCHEMA_FILE) as schema, self.conn.cursor() as cur:
+            for statement in schema.read().split(';'):
+                if statement.strip() and not statement.strip().startswith('--'):
+                    cur.execute(statement)
+
+    def install(self, flask_app):
+        flask_app.config.update(self.config)
+
+    def execute(self, query, args=()):
+        with self.conn.cursor() as cur:
+            cur.execute(query, args)
+
+    def executemany(self, query, rows):
+        with self.conn.cursor() as cur:
+            cur.executemany(query, rows)
+
+
+def build_app(backend, hashing_workers):
+    config = {
+        'MONGO_URI': 'mongodb://localhost:27017/bench',
+        'JWT_SECRET_KEY': 'benchmark',
+        'DB_HOST': 'localhost', 'DB_PORT': 3306, 'DB_USER': 'bench', 'DB_PASS': '', 'DB_NAME': 'bench',
+        'MAIL_USERNAME': 'noreply@example.org',
+        'MAIL_SUPPRESS_SEND': True,
+        'HASHING_WORKERS': hashing_workers,
+        'RESPONSE_CACHE_TTL': 0,
+        'JOB_RESUME_ON_STARTUP': False,
+        'MONGO_ENSURE_INDEXES': False,
+        'LOG_REQUESTS': False,
+    }
+    with tempfile.NamedTemporaryFile('w', suffix='.py', delete=False) as config_file:
+        for key, value in config.items():
+            config_file.write(f'{key} = {value!r}\n')
+    os.environ['FLASK_CONFIG_FILE'] = config_file.name
+
+    from app import create_app
+    from app.helpers.extensions import mongo
+    from flask_jwt_extended import create_access_token
+
+    flask_app = create_app()
+    os.unlink(config_file.name)
+    mongo.cx = mongomock.MongoClient()
+    mongo.db = mongo.cx['bench']
+    backend.install(flask_app)
+    with flask_app.app_context():
+        token = create_access_token(identity={'username': 'benchmark',
+                                              'roles': ['ADMINISTRATOR', 'PROGRAM_COMMITTEE']})
+    return flask_app, {'Authorization': f'Bearer {token}'}
+
+
+def reset_users(backend):
+    backend.execute('DELETE FROM conference_user_role')
+    backend.execute('DELETE FROM user')
+
+
+def seed_users(backend, count, prefix='seed'):
+    backend.executemany('INSERT INTO user(username, password, first_name, last_name, valid_account, is_phd, '
+                        'educational_title, is_active) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)',
+                        [(f'{prefix}{i}@example.org', SEED_PASSWORD_HASH, 'First', 'Last', i % 2, 0, 'Drd.', 0)
+                         for i in range(count)])
+    backend.execute('INSERT INTO conference_user_role(conference_id, user_id, role_id) '
+                    'SELECT 1, id, 1 FROM user')
+    backend.execute('INSERT INTO conference_user_role(conference_id, user_id, role_id) '
+                    'SELECT 1, id, 2 FROM user WHERE valid_account = 1')
+
+
+def new_users(batch, count):
+    password = base64.b64encode(b'password').decode()
+    return [{'username': f'new{batch}-{i}@example.org', 'password': password, 'first_name': 'First',
+             'last_name': 'Last', 'valid_account': 0, 'is_phd': 0, 'educational_title': 'Drd.', 'conference_id': 1,
+             'roles': [1]} for i in range(count)]
+
+
+def sessions(count):
+    return [{'eventId': i, 'title': f'Session {i}', 'room': f'Room {i % 12}', 'conferenceId': 1,
+             'startTime': 1584437524 + 1800 * (i // 12), 'endTime': 1584437524 + 1800 * (i // 12) + 1500,
+             'speakers': [f'speaker{i}@example.org']} for i in range(count)]
+
+
+def measure(label, items, iterations, run, prepare=None):
+    latencies = []
+    for iteration in range(iterations):
+        if prepare is not None:
+            prepare(iteration)
+        started = time.perf_counter()
+        response = run(iteration)
+        # streamed bodies are produced while they are read
+        body = response.get_data()
+        latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{label} failed with {response.status_code}: {body[:200]!r}')
+    latencies.sort()
+
+    def percentile(fraction):
+        return latencies[min(len(latencies) - 1, int(round(fraction * (len(latencies) - 1))))] * 1000
+
+    result = {'iterations': iterations, 'items_per_iteration': items,
+              'mean_ms': statistics.mean(latencies) * 1000, 'p50_ms': percentile(0.5),
+              'p90_ms': percentile(0.9), 'p99_ms': percentile(0.99), 'max_ms': latencies[-1] * 1000,
+              'items_per_second': items * iterations / sum(latencies)}
+    print(f'{label:32} p50 {result["p50_ms"]:10.1f} ms  p99 {result["p99_ms"]:10.1f} ms  '
+          f'{result["items_per_second"]:12.1f} items/s', file=sys.stderr)
+    return result
+
+
+def run_benchmarks(args):
+    backend = MySQLBackend() if args.mysql else FakeBackend()
+    flask_app, headers = build_app(backend, args.hashing_workers)
+    client = flask_app.test_client()
+    results = {}
+
+    reset_users(backend)
+    results['create_users'] = measure(
+        'create_users', args.create_batch, args.iterations,
+        lambda i: client.post('/api/admin/users', json=new_users(i, args.create_batch), headers=headers))
+
+    for size in args.user_counts:
+        reset_users(backend)
+        seed_users(backend, size)
+        results[f'get_users_{size}'] = measure(
+            f'get_users[{size}]', size, args.iterations,
+            lambda i: client.get('/api/admin/users', headers=headers))
+        results[f'get_users_gzip_{size}'] = measure(
+            f'get_users[{size}, gzip]', size, args.iterations,
+            lambda i: client.get('/api/admin/users', headers=dict(headers, **{'Accept-Encoding': 'gzip'})))
+        results[f'get_users_filtered_{size}'] = measure(
+            f'get_users[{size}, role 2, page]', min(size // 2, 1000), args.iterations,
+            lambda i: client.get('/api/admin/users?conference_id=1&role_id=2&limit=1000', headers=headers))
+
+    results['update_conference_sessions'] = measure(
+        'update_conference_sessions', args.session_count, args.iterations,
+        lambda i: client.put('/api/admin/conferences/sessions', json=sessions(args.session_count), headers=headers))
+
+    def reseed(iteration):
+        reset_users(backend)
+        seed_users(backend, args.delete_count)
+
+    results['delete_users'] = measure(
+        'delete_users', args.delete_count, args.iterations,
+        lambda i: client.delete('/api/admin/users', headers=headers,
+                                json=[{'username': f'seed{n}@example.org'} for n in range(args.delete_count)]),
+        prepare=reseed)
+    return backend, results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(__file__)).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_file):
+    with open(baseline_file) as baseline:
+        baseline_results = json.load(baseline)['results']
+    for name, result in results.items():
+        previous = baseline_results.get(name)
+        if previous is None:
+            continue
+        change = (result['p50_ms'] - previous['p50_ms']) / previous['p50_ms'] * 100
+        print(f'{name:32} p50 {previous["p50_ms"]:10.1f} -> {result["p50_ms"]:10.1f} ms ({change:+.1f}%)',
+              file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--mysql', action='store_true', help='use the scratch MySQL database from BENCH_DB_*')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help='previous results file to diff against')
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--user-counts', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--create-batch', type=int, default=20, help='users per create request, hashed with bcrypt')
+    parser.add_argument('--session-count', type=int, default=1000)
+    parser.add_argument('--delete-count', type=int, default=5000)
+    parser.add_argument('--hashing-workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    backend, results = run_benchmarks(args)
+    report = {'revision': git_revision(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+              'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+              'mysql_backend': backend.name, 'arguments': vars(args), 'results': results}
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
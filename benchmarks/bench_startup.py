@@ -0,0 +1,100 @@
+"""Cold start benchmark: import of ``app`` to the first answered request.
+
+Every run is a fresh interpreter that imports ``app``, calls ``create_app`` and serves ``GET /metrics`` through the
+test client, which touches neither MongoDB nor MySQL. Runs alternate between building the Swagger spec with
+flasgger and loading the prebuilt spec from ``SWAGGER_SPEC_FILE``.
+
+    python -m benchmarks.bench_startup --output bench_results_startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_admin_api import git_revision
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+flask_app = create_app()
+created = time.perf_counter()
+response = flask_app.test_client().get('/metrics')
+answered = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print(json.dumps({'import_ms': (imported - started) * 1000, 'create_app_ms': (created - imported) * 1000,
+                  'first_request_ms': (answered - created) * 1000, 'total_ms': (answered - started) * 1000}))
+"""
+
+
+def write_config(directory, spec_file):
+    config = {
+        'MONGO_URI': 'mongodb://localhost:27017/bench',
+        'JWT_SECRET_KEY': 'benchmark',
+        'MONGO_ENSURE_INDEXES': False,
+        'JOB_RESUME_ON_STARTUP': False,
+        'LOG_REQUESTS': False,
+    }
+    if spec_file is not None:
+        config['SWAGGER_SPEC_FILE'] = spec_file
+    path = os.path.join(directory, 'prebuilt.py' if spec_file else 'flasgger.py')
+    with open(path, 'w') as config_file:
+        for key, value in config.items():
+            config_file.write(f'{key} = {value!r}\n')
+    return path
+
+
+def probe(config_file):
+    env = dict(os.environ, FLASK_CONFIG_FILE=config_file, PYTHONPATH=ROOT)
+    output = subprocess.check_output([sys.executable, '-c', PROBE], cwd=ROOT, env=env)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def summarize(label, samples):
+    result = {'runs': len(samples)}
+    for key in ('import_ms', 'create_app_ms', 'first_request_ms', 'total_ms'):
+        values = sorted(sample[key] for sample in samples)
+        result[key] = {'median': statistics.median(values), 'min': values[0], 'max': values[-1]}
+    print(f'{label:10} import {result["import_ms"]["median"]:8.1f} ms  create_app '
+          f'{result["create_app_ms"]["median"]:8.1f} ms  first request {result["first_request_ms"]["median"]:8.1f} '
+          f'ms  total {result["total_ms"]["median"]:8.1f} ms', file=sys.stderr)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--output', default='bench_results_startup.json')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        spec_file = os.path.join(directory, 'swagger.json')
+        subprocess.check_call([sys.executable, '-m', 'app.swagger_spec', '--output', spec_file], cwd=ROOT,
+                              env=dict(os.environ, PYTHONPATH=ROOT))
+        configs = {'flasgger': write_config(directory, None), 'prebuilt': write_config(directory, spec_file)}
+        # one warm-up each so both modes read compiled bytecode
+        for config_file in configs.values():
+            probe(config_file)
+        samples = {mode: [] for mode in configs}
+        for _ in range(args.runs):
+            for mode, config_file in configs.items():
+                samples[mode].append(probe(config_file))
+
+    results = {mode: summarize(mode, mode_samples) for mode, mode_samples in samples.items()}
+    report = {'revision': git_revision(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+              'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+              'arguments': vars(args), 'results': results}
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Cost of request body validation per 1k items.
+
+Builds the request schemas from the controller docstrings the way ``create_app`` does and validates bulk
+payloads of ``POST /api/admin/users`` and ``PUT /api/admin/users`` directly, without HTTP or a database.
+
+    python -m benchmarks.bench_validation --output bench_results_validation.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+from flask import Flask
+
+from benchmarks.bench_admin_api import git_revision, new_users
+
+
+def updated_users(count):
+    return [{'username': f'new0-{i}@example.org', 'first_name': 'First', 'last_name': 'Last', 'valid_account': 1,
+             'is_phd': 0, 'educational_title': 'Drd.'} for i in range(count)]
+
+
+def invalid(users):
+    # every item breaks one rule, so each one produces an error
+    broken = []
+    for i, user in enumerate(users):
+        user = dict(user)
+        if i % 2:
+            user.pop('username')
+        else:
+            user['valid_account'] = 'yes'
+        broken.append(user)
+    return broken
+
+
+def measure(label, run, items, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    per_thousand = sorted(timing / items * 1000 * 1000 for timing in timings)
+    result = {'iterations': iterations, 'items': items, 'median_ms_per_1k': statistics.median(per_thousand),
+              'min_ms_per_1k': per_thousand[0], 'max_ms_per_1k': per_thousand[-1]}
+    print(f'{label:28} {result["median_ms_per_1k"]:8.2f} ms per 1k items', file=sys.stderr)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--output', default='bench_results_validation.json')
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    from app import register_blueprints
+    from app.helpers.helpers_validation import body_errors, build_request_schemas
+
+    flask_app = Flask('app')
+    register_blueprints(flask_app)
+    started = time.perf_counter()
+    build_request_schemas(flask_app)
+    results = {'build_schemas_ms': (time.perf_counter() - started) * 1000}
+    started = time.perf_counter()
+    body_errors(flask_app, 'admin_user_management.admin_create_user', [])
+    results['first_compile_ms'] = (time.perf_counter() - started) * 1000
+    print(f'{"build schemas":28} {results["build_schemas_ms"]:8.2f} ms\n'
+          f'{"import + compile validator":28} {results["first_compile_ms"]:8.2f} ms', file=sys.stderr)
+
+    payloads = {
+        'create_users_valid': ('admin_user_management.admin_create_user', new_users(0, args.items)),
+        'create_users_invalid': ('admin_user_management.admin_create_user', invalid(new_users(0, args.items))),
+        'update_users_valid': ('admin_user_management.admin_update_user', updated_users(args.items)),
+    }
+    for name, (endpoint, body) in payloads.items():
+        results[name] = measure(name, lambda: body_errors(flask_app, endpoint, body), args.items, args.iterations)
+
+    report = {'revision': git_revision(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+              'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+              'arguments': vars(args), 'results': results}
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
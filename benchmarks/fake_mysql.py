@@ -0,0 +1,153 @@
+"""In-process stand-in for the MySQL connections handed out by ``get_connection``.
+
+Statements are rewritten to SQLite's dialect and run against an in-memory database, which keeps the benchmark
+self-contained when no scratch MySQL/MariaDB server is available. Absolute numbers are not comparable with a
+real server; use it to compare commits against each other.
+"""
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pymysql
+
+SCHEMA = """
+CREATE TABLE conference (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title VARCHAR(255) NOT NULL UNIQUE,
+    path_to_logo VARCHAR(255),
+    location VARCHAR(255),
+    path_to_description VARCHAR(255),
+    country VARCHAR(255),
+    start_date DATETIME,
+    end_date DATETIME
+);
+CREATE TABLE user (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(255) NOT NULL UNIQUE,
+    password VARCHAR(255) NOT NULL,
+    first_name VARCHAR(255),
+    last_name VARCHAR(255),
+    valid_account TINYINT,
+    is_phd TINYINT,
+    educational_title VARCHAR(255),
+    is_active TINYINT
+);
+CREATE TABLE conference_user_role (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conference_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    role_id INTEGER NOT NULL
+);
+CREATE INDEX user_conference_role ON conference_user_role (user_id, conference_id, role_id);
+CREATE INDEX conference_role_user ON conference_user_role (conference_id, role_id, user_id);
+"""
+
+_UPDATE_JOIN = re.compile(r'^UPDATE (\w+) (\w+) JOIN (\w+) (\w+) ON (.+?) set (.+)$', re.IGNORECASE | re.DOTALL)
+_DROP_TEMPORARY = re.compile(r'^DROP TEMPORARY TABLE (IF EXISTS )?(\w+)', re.IGNORECASE)
+_CREATE_TEMPORARY_SELECT = re.compile(r'^CREATE TEMPORARY TABLE (\w+) \(PRIMARY KEY \(\w+\)\) (SELECT .+)$',
+                                      re.IGNORECASE | re.DOTALL)
+
+
+def _translate(query):
+    query = query.replace('%s', '?').replace('<=>', 'IS')
+    match = _UPDATE_JOIN.match(query)
+    if match:
+        table, alias, source, source_alias, condition, assignments = match.groups()
+        assignments = re.sub(rf'\b{alias}\.(\w+)=', r'\1=', assignments)
+        return f'UPDATE {table} AS {alias} SET {assignments} FROM {source} AS {source_alias} WHERE {condition}'
+    match = _DROP_TEMPORARY.match(query)
+    if match:
+        return f'DROP TABLE {match.group(1) or ""}temp.{match.group(2)}'
+    match = _CREATE_TEMPORARY_SELECT.match(query)
+    if match:
+        # SQLite cannot declare keys on CREATE TABLE ... AS SELECT; the staged rows are unique already
+        return f'CREATE TEMP TABLE {match.group(1)} AS {match.group(2)}'
+    return query
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection.db.cursor()
+        self.rowcount = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._cursor.close()
+
+    def _wrap(self, call):
+        try:
+            return call()
+        except sqlite3.IntegrityError as e:
+            raise pymysql.err.IntegrityError(1062, f'Duplicate entry: {e}')
+
+    def execute(self, query, args=None):
+        self._wrap(lambda: self._cursor.execute(_translate(query), tuple(args or ())))
+        self.rowcount = self._cursor.rowcount if self._cursor.description is None else -1
+        return self.rowcount
+
+    def executemany(self, query, args):
+        self._wrap(lambda: self._cursor.executemany(_translate(query), [tuple(row) for row in args]))
+        self.rowcount = self._cursor.rowcount
+        return self.rowcount
+
+    def _row(self, row):
+        return {column[0]: value for column, value in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        return self._row(row) if row is not None else None
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        for row in self._cursor:
+            yield self._row(row)
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self, cursor=None):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.db = sqlite3.connect(':memory:', check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def connection(self, *args, **kwargs):
+        # one SQLite connection serialises every checkout, like a pool of size one
+        with self._lock:
+            conn = FakeConnection(self.db)
+            try:
+                yield conn
+            finally:
+                self.db.rollback()
+
+    def execute(self, query, args=()):
+        with self._lock:
+            self.db.execute(_translate(query), args)
+            self.db.commit()
+
+    def executemany(self, query, rows):
+        with self._lock:
+            self.db.executemany(_translate(query), rows)
+            self.db.commit()
@@ -0,0 +1,32 @@
+-- Tables touched by the admin API, for a scratch benchmark database.
+CREATE TABLE IF NOT EXISTS conference (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    title VARCHAR(255) NOT NULL UNIQUE,
+    path_to_logo VARCHAR(255),
+    location VARCHAR(255),
+    path_to_description VARCHAR(255),
+    country VARCHAR(255),
+    start_date DATETIME,
+    end_date DATETIME
+);
+
+CREATE TABLE IF NOT EXISTS user (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    username VARCHAR(255) NOT NULL UNIQUE,
+    password VARCHAR(255) NOT NULL,
+    first_name VARCHAR(255),
+    last_name VARCHAR(255),
+    valid_account TINYINT,
+    is_phd TINYINT,
+    educational_title VARCHAR(255),
+    is_active TINYINT
+);
+
+CREATE TABLE IF NOT EXISTS conference_user_role (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    conference_id INT NOT NULL,
+    user_id INT NOT NULL,
+    role_id INT NOT NULL,
+    INDEX user_conference_role (user_id, conference_id, role_id),
+    INDEX conference_role_user (conference_id, role_id, user_id)
+);
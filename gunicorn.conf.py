@@ -0,0 +1,18 @@
+# gunicorn -c gunicorn.conf.py app.wsgi:application
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5001')
+# threaded workers: requests in one process share its connection pools, hashing pool and admission limits, which
+# would never queue or reject anything if each process served one request at a time
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+# build the app once in the master; the workers share it copy-on-write
+preload_app = True
+
+
+def post_fork(server, worker):
+    from app.helpers.helpers_workers import init_worker
+    from app.wsgi import application
+    init_worker(application, web_workers=server.cfg.workers)
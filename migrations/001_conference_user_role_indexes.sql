@@ -0,0 +1,8 @@
+-- Indexes for the role lookups of the admin API.
+--
+-- user_conference_role serves the per-user role joins of GET /api/admin/users and the role deletes of
+-- delete_users; conference_role_user serves the conference_id/role_id filters of GET /api/admin/users. Both
+-- carry the remaining columns so those queries are answered from the index alone.
+ALTER TABLE conference_user_role
+    ADD INDEX user_conference_role (user_id, conference_id, role_id),
+    ADD INDEX conference_role_user (conference_id, role_id, user_id);
@@ -0,0 +1,167 @@
+import threading
+import time
+
+import pymysql
+import pytest
+from pymysql.constants import SERVER_STATUS
+
+from app.helpers.helpers_database import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self):
+        self.server_status = 0
+        self.closed = False
+        self.force_closed = False
+        self.rollbacks = 0
+        self.ping_error = None
+
+    def ping(self, reconnect=True):
+        if self.ping_error is not None:
+            raise self.ping_error
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.server_status &= ~SERVER_STATUS.SERVER_STATUS_IN_TRANS
+
+    def close(self):
+        self.closed = True
+
+    def _force_close(self):
+        self.force_closed = True
+
+
+class FakeConnect:
+    def __init__(self):
+        self.opened = []
+
+    def __call__(self, **kwargs):
+        conn = FakeConnection()
+        self.opened.append(conn)
+        return conn
+
+
+def new_pool(**options):
+    connect = FakeConnect()
+    options.setdefault('min_size', 0)
+    return ConnectionPool({}, connect=connect, **options), connect
+
+
+def test_min_size_connections_are_opened_up_front():
+    pool, connect = new_pool(min_size=3)
+    assert len(connect.opened) == 3
+    assert pool.stats()['idle'] == 3
+
+
+def test_released_connection_is_reused_without_a_handshake():
+    pool, connect = new_pool(min_size=1)
+    for _ in range(3):
+        with pool.connection() as conn:
+            assert conn is connect.opened[0]
+    stats = pool.stats()
+    assert (stats['handshakes'], stats['handshakes_avoided'], stats['checkouts']) == (1, 3, 3)
+    assert (stats['size'], stats['idle'], stats['in_use']) == (1, 1, 0)
+
+
+def test_checkout_times_out_when_the_pool_is_exhausted():
+    pool, _ = new_pool(max_size=1, checkout_timeout=0.05)
+    pooled = pool.checkout()
+    started = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.checkout()
+    assert time.monotonic() - started >= 0.05
+    assert pool.stats()['timeouts'] == 1
+    pool.release(pooled)
+    assert pool.checkout() is pooled
+
+
+def test_checkout_blocks_until_a_connection_is_released():
+    pool, connect = new_pool(max_size=1, checkout_timeout=5)
+    pooled = pool.checkout()
+    threading.Timer(0.05, pool.release, args=(pooled,)).start()
+    assert pool.checkout() is pooled
+    stats = pool.stats()
+    assert len(connect.opened) == 1
+    assert stats['wait_time_max'] >= 0.04
+
+
+def test_connection_is_returned_after_an_exception():
+    pool, connect = new_pool()
+    with pytest.raises(ValueError):
+        with pool.connection():
+            raise ValueError('query failed')
+    stats = pool.stats()
+    assert (stats['size'], stats['idle'], stats['in_use']) == (1, 1, 0)
+    assert not connect.opened[0].closed
+
+
+def test_open_transaction_is_rolled_back_on_release():
+    pool, connect = new_pool()
+    with pool.connection() as conn:
+        conn.server_status |= SERVER_STATUS.SERVER_STATUS_IN_TRANS
+    assert connect.opened[0].rollbacks == 1
+    assert pool.stats()['idle'] == 1
+
+
+def test_broken_connection_is_discarded():
+    pool, connect = new_pool()
+    with pytest.raises(pymysql.err.OperationalError):
+        with pool.connection():
+            raise pymysql.err.OperationalError(2013, 'Lost connection to MySQL server during query')
+    assert connect.opened[0].closed
+    assert (pool.stats()['size'], pool.stats()['idle']) == (0, 0)
+    with pool.connection() as conn:
+        assert conn is connect.opened[1]
+
+
+def test_connection_failing_ping_is_replaced_on_checkout():
+    pool, connect = new_pool(min_size=1)
+    connect.opened[0].ping_error = pymysql.err.OperationalError(2006, 'MySQL server has gone away')
+    with pool.connection() as conn:
+        assert conn is connect.opened[1]
+    assert connect.opened[0].closed
+    assert pool.stats()['size'] == 1
+
+
+def test_expired_connection_is_discarded_on_checkout():
+    pool, connect = new_pool(min_size=1, max_lifetime=0.01)
+    time.sleep(0.02)
+    with pool.connection() as conn:
+        assert conn is connect.opened[1]
+    assert connect.opened[0].closed
+    assert pool.stats()['size'] == 1
+
+
+def test_idle_connections_above_the_minimum_are_closed_under_light_traffic():
+    pool, connect = new_pool(min_size=1, max_size=5, idle_timeout=0.05)
+    held = [pool.checkout() for _ in range(5)]
+    for pooled in held:
+        pool.release(pooled)
+    deadline = time.monotonic() + 0.3
+    while time.monotonic() < deadline:
+        with pool.connection():
+            pass
+        time.sleep(0.01)
+    assert sum(not conn.closed for conn in connect.opened) == 1
+    assert (pool.stats()['size'], pool.stats()['idle']) == (1, 1)
+
+
+def test_failed_connect_frees_its_slot():
+    pool, connect = new_pool(max_size=1, checkout_timeout=0.05)
+
+    def refuse(**kwargs):
+        raise pymysql.err.OperationalError(2003, "Can't connect to MySQL server")
+
+    pool.connect = refuse
+    with pytest.raises(pymysql.err.OperationalError):
+        pool.checkout()
+    pool.connect = connect
+    with pool.connection() as conn:
+        assert conn is connect.opened[0]
+
+
+def test_abandon_closes_idle_connections_without_quit():
+    pool, connect = new_pool(min_size=2)
+    pool.abandon()
+    assert all(conn.force_closed and not conn.closed for conn in connect.opened)
+    assert pool.stats()['size'] == 0
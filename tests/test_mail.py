@@ -0,0 +1,51 @@
+import socket
+
+from flask import Flask
+from flask_mail import Mail, Message
+
+from app.helpers.helpers_mail import MailQueue
+
+
+def mail_app(port):
+    flask_app = Flask(__name__)
+    flask_app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=port, MAIL_USERNAME='admin@example.org',
+                            MAIL_DEFAULT_SENDER='admin@example.org')
+    return flask_app, Mail(flask_app)
+
+
+def messages(recipients):
+    return [Message(subject='Account created.', sender='admin@example.org', recipients=[recipient], body='Hi')
+            for recipient in recipients]
+
+
+def unused_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def deliver(flask_app, mail, recipients, **options):
+    mail_queue = MailQueue(flask_app, mail, workers=1, retry_backoff=0.01, **options)
+    mail_queue.put(messages(recipients))
+    mail_queue.close(timeout=10)
+    return mail_queue
+
+
+def test_batch_is_delivered_over_smtp(smtp_sink):
+    recipients = [f'user{i}@example.org' for i in range(20)]
+    mail_queue = deliver(*mail_app(smtp_sink.port), recipients, batch_size=8)
+    assert (mail_queue.sent, mail_queue.failed) == (20, 0)
+    assert sorted(smtp_sink.delivered) == sorted(recipients)
+
+
+def test_refused_recipient_only_drops_its_message(smtp_sink):
+    smtp_sink.refused.add('gone@example.org')
+    recipients = ['gone@example.org'] + [f'user{i}@example.org' for i in range(10)]
+    mail_queue = deliver(*mail_app(smtp_sink.port), recipients, batch_size=50)
+    assert (mail_queue.sent, mail_queue.failed) == (10, 1)
+    assert sorted(smtp_sink.delivered) == sorted(recipients[1:])
+
+
+def test_unreachable_server_fails_the_batch_after_retries():
+    mail_queue = deliver(*mail_app(unused_port()), ['user@example.org', 'other@example.org'], max_retries=2)
+    assert (mail_queue.sent, mail_queue.failed) == (0, 2)
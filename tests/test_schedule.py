@@ -0,0 +1,72 @@
+from app.helpers.helpers_schedule import find_conflicts
+
+
+def session(event_id, start, end, room='A', speakers=(), conference_id=1):
+    return {'eventId': event_id, 'conferenceId': conference_id, 'startTime': start, 'endTime': end, 'room': room,
+            'speakers': list(speakers)}
+
+
+def batch(*sessions):
+    return list(enumerate(sessions))
+
+
+def pairs(conflicts):
+    return sorted((conflict['type'], tuple(item['eventId'] for item in conflict['sessions']))
+                  for conflict in conflicts)
+
+
+def test_overlapping_sessions_in_one_room_conflict():
+    conflicts, count = find_conflicts(batch(session(1, 0, 60), session(2, 30, 90)))
+    assert count == 1
+    assert conflicts == [{'type': 'room', 'resource': 'A', 'conferenceId': 1,
+                          'sessions': [{'index': 0, 'eventId': 1}, {'index': 1, 'eventId': 2}]}]
+
+
+def test_touching_sessions_do_not_conflict():
+    assert find_conflicts(batch(session(1, 0, 60), session(2, 60, 120))) == ([], 0)
+
+
+def test_speaker_conflicts_across_rooms_but_not_across_conferences():
+    conflicts, count = find_conflicts(batch(session(1, 0, 60, room='A', speakers=['ana']),
+                                            session(2, 30, 90, room='B', speakers=['ana']),
+                                            session(3, 30, 90, room='A', speakers=['ana'], conference_id=2)))
+    assert count == 1
+    assert pairs(conflicts) == [('speaker', (1, 2))]
+
+
+def test_incoming_session_conflicts_with_stored_one():
+    conflicts, count = find_conflicts(batch(session(2, 30, 90)), stored=[session(1, 0, 60)])
+    assert count == 1
+    assert conflicts[0]['sessions'] == [{'index': None, 'eventId': 1}, {'index': 0, 'eventId': 2}]
+
+
+def test_stored_sessions_are_not_checked_against_each_other():
+    assert find_conflicts(batch(session(3, 200, 260)), stored=[session(1, 0, 60), session(2, 30, 90)]) == ([], 0)
+
+
+def test_incoming_copy_replaces_the_stored_session():
+    stored = [session(1, 0, 60), session(2, 100, 160)]
+    # session 1 moves away from its old slot, which it would otherwise overlap
+    assert find_conflicts(batch(session(1, 10, 50)), stored=stored) == ([], 0)
+    # and is checked at its new time
+    conflicts, count = find_conflicts(batch(session(1, 120, 180)), stored=stored)
+    assert count == 1
+    assert pairs(conflicts) == [('room', (2, 1))]
+
+
+def test_last_copy_of_a_duplicate_event_id_is_checked():
+    conflicts, count = find_conflicts(batch(session(1, 0, 60), session(2, 100, 160), session(1, 120, 180)))
+    assert count == 1
+    assert conflicts[0]['sessions'] == [{'index': 1, 'eventId': 2}, {'index': 2, 'eventId': 1}]
+
+
+def test_sessions_without_a_valid_interval_are_skipped():
+    assert find_conflicts(batch(session(1, 0, 60), session(2, 90, 30), session(3, '10', 50))) == ([], 0)
+
+
+def test_limit_caps_the_reported_conflicts_but_not_the_count():
+    sessions = batch(*(session(event_id, 0, 60) for event_id in range(10)))
+    conflicts, count = find_conflicts(sessions, limit=5)
+    assert count == 45
+    assert len(conflicts) == 5
+    assert find_conflicts(sessions, limit=0) == ([], 45)